@@ -0,0 +1,151 @@
+# Рассылка через поддельный Bot API с лимитами Telegram (общий на бота и на чат, ответ 429 с retry_after).
+# Сравнивает наивную параллельную отправку с Broadcaster и проверяет продолжение прерванной рассылки.
+# Запуск: python benchmarks/broadcast.py [получателей]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:broadcast")
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramAPIError  # noqa: E402
+from broadcast import Broadcaster  # noqa: E402
+
+PORT = 18090
+GLOBAL_LIMIT = 30  # сообщений в секунду на бота
+CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+LATENCY = 0.03
+
+
+# Поддельный Bot API: sendMessage с задержкой и лимитами, как у Telegram
+class FakeBotAPI:
+    def __init__(self):
+        self.recent = deque()
+        self.last_chat = {}
+        self.delivered = Counter()
+        self.rejected = 0
+
+    async def send_message(self, request):
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        await asyncio.sleep(LATENCY)
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > 1:
+            self.recent.popleft()
+        if len(self.recent) >= GLOBAL_LIMIT or now - self.last_chat.get(chat_id, -CHAT_INTERVAL) < CHAT_INTERVAL:
+            self.rejected += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        self.recent.append(now)
+        self.last_chat[chat_id] = now
+        self.delivered[chat_id] += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": sum(self.delivered.values()), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": data["text"]}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", PORT).start()
+
+
+def make_bot():
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}"))
+    return Bot(token=os.environ["BOT_TOKEN"], session=session)
+
+
+# Наивная рассылка: все сообщения сразу с ограничением только на число одновременных запросов
+async def naive(bot, targets, concurrency=50):
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def send(chat_id):
+        nonlocal errors
+        async with semaphore:
+            try:
+                await bot.send_message(chat_id, "Не забывайте пить воду!")
+            except TelegramAPIError:
+                errors += 1
+
+    await asyncio.gather(*(send(chat_id) for chat_id in targets))
+    return errors
+
+
+def make_broadcaster(directory, global_rate=25):
+    broadcaster = Broadcaster(directory, global_rate=global_rate, chat_rate=1, concurrency=10, save_interval=0.2)
+    broadcaster.register("water", lambda chat_id: "Не забывайте пить воду!")
+    return broadcaster
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    targets = list(range(1, count + 1))
+    server = FakeBotAPI()
+    await server.start()
+    bot = make_bot()
+
+    begin = time.perf_counter()
+    errors = await naive(bot, targets)
+    elapsed = time.perf_counter() - begin
+    print(f"{'наивно':>12}: доставлено {sum(server.delivered.values())}/{count} за {elapsed:.1f} с, "
+          f"отклонено 429: {server.rejected}, потеряно: {errors}")
+    await asyncio.sleep(1.5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.delivered.clear()
+        server.rejected = 0
+        broadcaster = make_broadcaster(tmp)
+        broadcaster.submit("water", targets)
+        begin = time.perf_counter()
+        await broadcaster.run_job(bot, broadcaster._queue.get_nowait())
+        elapsed = time.perf_counter() - begin
+        print(f"{'Broadcaster':>12}: доставлено {sum(server.delivered.values())}/{count} за {elapsed:.1f} с "
+              f"({broadcaster.sent / elapsed:.1f} сообщ/с), отклонено 429: {server.rejected}")
+        await asyncio.sleep(1.5)
+
+        # Лимит в настройках выше реального: Telegram отвечает 429, рассылка встает на паузу и ничего не теряет
+        server.delivered.clear()
+        server.rejected = 0
+        broadcaster = make_broadcaster(tmp, global_rate=40)
+        broadcaster.submit("water", targets)
+        begin = time.perf_counter()
+        await broadcaster.run_job(bot, broadcaster._queue.get_nowait())
+        elapsed = time.perf_counter() - begin
+        print(f"{'выше лимита':>12}: доставлено {sum(server.delivered.values())}/{count} за {elapsed:.1f} с, "
+              f"отклонено 429: {server.rejected}, повторов после retry_after: {broadcaster.retries}")
+        await asyncio.sleep(1.5)
+
+        # Прерывание посреди рассылки и продолжение новым экземпляром с того же каталога
+        server.delivered.clear()
+        server.rejected = 0
+        first = make_broadcaster(tmp)
+        first.submit("water", targets)
+        first.start(bot)
+        await asyncio.sleep(count / 25 / 2)
+        await first.stop()
+        interrupted_at = sum(server.delivered.values())
+        second = make_broadcaster(tmp)
+        second.resume()
+        await second.run_job(bot, second._queue.get_nowait())
+        duplicates = sum(n - 1 for n in server.delivered.values() if n > 1)
+        missing = count - len(server.delivered)
+        print(f"{'продолжение':>12}: прервано после {interrupted_at}, после перезапуска всего "
+              f"{len(server.delivered)}/{count}, повторов {duplicates}, пропущено {missing}")
+
+    await bot.session.close()
+    await server.runner.cleanup()
+    if missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+# Холодный старт: время импорта bot.py и время до первого ответа нового процесса бота.
+# Бот запускается как есть (python bot.py, long polling) против заглушки Bot API: заглушка отдает одну команду /start
+# и засекает момент, когда бот ответил на нее. Отдельно меряется первый график в новом процессе после импорта бота
+# (без прогрева он включает загрузку matplotlib).
+#
+# Запуск: python benchmarks/cold_start.py --runs 5 --output cold.json
+#         python benchmarks/cold_start.py --compare cold.json
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_PORT = 18095
+
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import bot
+print(time.perf_counter() - start, "matplotlib" in sys.modules)
+"""
+
+CHART_PROBE = """
+import time
+import bot
+from functions import generate_progress_chart
+start = time.perf_counter()
+values = {"water_goal": 2500, "logged_water": 1000, "calorie_goal": 2000.0, "logged_calories": 900.0, "burned_calories": 300.0}
+generate_progress_chart(values, "water")
+print(time.perf_counter() - start)
+"""
+
+
+def bot_environment(tmp: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123456:cold-start", "TELEGRAM_API_URL": f"http://127.0.0.1:{API_PORT}",
+        "METRICS_ENABLED": "0", "EVENT_LOG_DIR": os.path.join(tmp, "events"),
+        "BROADCAST_DIR": os.path.join(tmp, "broadcasts"), "DAY_ARCHIVE_PATH": os.path.join(tmp, "days.bin"),
+        "USER_DB_PATH": os.path.join(tmp, "users.db"), "FSM_DB_PATH": os.path.join(tmp, "fsm.db"),
+        "PYTHONPATH": ROOT,
+    })
+    return env
+
+
+def probe(code: str, env: dict, cwd: str) -> list:
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=cwd, capture_output=True, text=True, check=True)
+    return output.stdout.split()
+
+
+# Самые тяжелые модули при импорте bot (по python -X importtime, с учетом вложенных импортов), верхний уровень
+def heaviest_imports(env: dict, cwd: str, top: int = 8) -> list:
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"], env=env, cwd=cwd,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Отступ имени - глубина вложенности; берем модули, импортированные непосредственно из bot и наших модулей
+        if len(name) - len(name.lstrip()) <= 3:
+            modules.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+# Заглушка Bot API: первый getUpdates возвращает /start, ответ бота (sendMessage) отмечает момент первого ответа
+async def start_fake_api(answered: asyncio.Event):
+    state = {"delivered": False}
+
+    async def handle(request):
+        method = request.match_info["method"]
+        data = await request.post()
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 123456, "is_bot": True, "first_name": "bot", "username": "cold_start_bot"}})
+        if method == "getUpdates":
+            if not state["delivered"]:
+                state["delivered"] = True
+                user = {"id": 1000, "is_bot": False, "first_name": "user"}
+                return web.json_response({"ok": True, "result": [{"update_id": 1, "message": {
+                    "message_id": 1, "date": int(time.time()), "text": "/start",
+                    "chat": {"id": 1000, "type": "private"}, "from": user}}]})
+            await asyncio.sleep(0.5)
+            return web.json_response({"ok": True, "result": []})
+        if method == "sendMessage":
+            answered.set()
+        return web.json_response({"ok": True, "result": {
+            "message_id": 2, "date": int(time.time()), "text": data.get("text", ""),
+            "chat": {"id": int(data.get("chat_id", 1000)), "type": "private"}}})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+    return runner
+
+
+async def first_response(env: dict, cwd: str) -> float:
+    answered = asyncio.Event()
+    runner = await start_fake_api(answered)
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, "bot.py"), env=env, cwd=cwd,
+                                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.wait_for(answered.wait(), 60)
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        await process.wait()
+        await runner.cleanup()
+
+
+def run(runs: int) -> dict:
+    imports, responses, charts = [], [], []
+    matplotlib_loaded = False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = bot_environment(tmp)
+        for _ in range(runs):
+            seconds, loaded = probe(IMPORT_PROBE, env, tmp)
+            imports.append(float(seconds))
+            matplotlib_loaded = matplotlib_loaded or loaded == "True"
+            charts.append(float(probe(CHART_PROBE, env, tmp)[0]))
+            responses.append(asyncio.run(first_response(env, tmp)))
+        heaviest = heaviest_imports(env, tmp)
+    return {
+        "runs": runs,
+        "import_s": statistics.median(imports),
+        "first_response_s": statistics.median(responses),
+        "first_chart_s": statistics.median(charts),
+        "matplotlib_on_import": matplotlib_loaded,
+        "heaviest_imports": heaviest,
+    }
+
+
+def print_report(result, baseline=None):
+    def delta(key):
+        if not baseline or not baseline.get(key):
+            return ""
+        return f" ({(result[key] - baseline[key]) / baseline[key] * 100:+.0f}%)"
+
+    print(f"импорт bot (медиана из {result['runs']}): {result['import_s'] * 1000:.0f} мс{delta('import_s')}; "
+          f"matplotlib загружен при импорте: {'да' if result['matplotlib_on_import'] else 'нет'}")
+    print(f"от запуска процесса до первого ответа: {result['first_response_s'] * 1000:.0f} мс{delta('first_response_s')}")
+    print(f"первый график в новом процессе: {result['first_chart_s'] * 1000:.0f} мс{delta('first_chart_s')}")
+    print("самые тяжелые импорты:")
+    for seconds, name in result["heaviest_imports"]:
+        print(f"  {name:<40}{seconds * 1000:8.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с результатами предыдущего запуска (JSON)")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
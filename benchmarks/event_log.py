@@ -0,0 +1,63 @@
+# Пропускная способность журнала событий: запись синтетических событий, восстановление сводок и запросы истории.
+# Запуск: python benchmarks/event_log.py [событий] [пользователей]
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from events import EventLog, WATER, FOOD, WORKOUT, SECONDS_PER_DAY  # noqa: E402
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    now = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = EventLog(tmp, segment_size=16 * 1024 * 1024, flush_interval=1)
+        log.open()
+        rng = random.Random(1)
+        start = time.perf_counter()
+        for i in range(events):
+            log.append(rng.randrange(users), rng.choice((WATER, FOOD, WORKOUT)), rng.random() * 500,
+                       now - rng.random() * 30 * SECONDS_PER_DAY)
+            if i % 10_000 == 0:
+                log.flush()
+        log.flush()
+        ingest = time.perf_counter() - start
+        log._file.close()
+        print(f"запись: {events / ingest:,.0f} событий/с, сегментов={len(log._segments())}")
+
+        # Полное восстановление сводок из сегментов (без снимка)
+        snapshot = os.path.join(tmp, "rollups.snapshot")
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+        start = time.perf_counter()
+        reopened = EventLog(tmp, segment_size=16 * 1024 * 1024, flush_interval=1)
+        reopened.open()
+        rebuild = time.perf_counter() - start
+        print(f"восстановление сводок: {reopened.events / rebuild:,.0f} событий/с ({rebuild:.2f} с)")
+
+        # Запуск со снимком сводок
+        reopened.flush()
+        reopened._file.close()
+        reopened.save_snapshot()
+        start = time.perf_counter()
+        reopened = EventLog(tmp, segment_size=16 * 1024 * 1024, flush_interval=1)
+        reopened.open()
+        print(f"запуск со снимком: {time.perf_counter() - start:.2f} с")
+        reopened._file.close()
+
+        for days in (7, 30):
+            queries = 100_000
+            start = time.perf_counter()
+            for _ in range(queries):
+                reopened.history(rng.randrange(users), days, int(now) // SECONDS_PER_DAY)
+            elapsed = time.perf_counter() - start
+            print(f"/history {days}: {elapsed / queries * 1e6:.1f} мкс на запрос")
+
+
+if __name__ == "__main__":
+    main()
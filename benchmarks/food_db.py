@@ -0,0 +1,101 @@
+# Офлайн-база продуктов: время построения индекса, память процесса и задержка поиска;
+# проверка ранжирования на маленьком индексе (точные совпадения важнее префиксов, важна доля описания).
+# Запуск: python benchmarks/food_db.py [продуктов | путь к выгрузке FDC]
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from food_db import FoodDatabase, build_index, read_fdc_export  # noqa: E402
+
+WORDS = ("banana apple rice chicken breast raw cooked boiled fried roasted salmon beef pork oats yogurt milk "
+         "cheese bread whole wheat white brown sugar free low fat organic frozen canned juice orange grape "
+         "tomato potato sweet corn bean black kidney lentil pasta egg butter peanut almond walnut").split()
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+# Синтетическая выгрузка в формате FDC CSV
+def write_synthetic_export(directory: str, count: int):
+    rng = random.Random(1)
+    with open(os.path.join(directory, "food.csv"), "w", newline="") as food_file, \
+            open(os.path.join(directory, "food_nutrient.csv"), "w", newline="") as nutrient_file:
+        foods = csv.writer(food_file)
+        nutrients = csv.writer(nutrient_file)
+        foods.writerow(["fdc_id", "data_type", "description"])
+        nutrients.writerow(["id", "fdc_id", "nutrient_id", "amount"])
+        for fdc_id in range(1, count + 1):
+            description = ", ".join(rng.sample(WORDS, rng.randint(2, 6))) + f" {fdc_id}"
+            foods.writerow([fdc_id, "branded_food", description.upper()])
+            nutrients.writerow([fdc_id * 2, fdc_id, 1003, rng.uniform(0, 30)])
+            nutrients.writerow([fdc_id * 2 + 1, fdc_id, 1008, rng.uniform(10, 900)])
+
+
+# Ранжирование: "banana" - это сам банан, а не банановый хлеб; префикс подставляется, только если точных нет
+def check_ranking(directory: str) -> bool:
+    index_path = os.path.join(directory, "ranking.idx")
+    build_index([("Bananas, raw", 89.0), ("Banana bread", 326.0), ("Bread, banana, homemade", 326.0),
+                 ("Bandage cake", 400.0)], index_path)
+    database = FoodDatabase(index_path)
+    expected = {"banana": ("Bananas, raw", 89.0), "bananas": ("Bananas, raw", 89.0),
+                "banana bread": ("Banana bread", 326.0), "bana": ("Bananas, raw", 89.0),
+                "bread ban": ("Banana bread", 326.0)}
+    ok = True
+    for query, answer in expected.items():
+        found = database.lookup(query)
+        print(f"  {'OK' if found == answer else 'ОШИБКА'}: {query!r} -> {found}")
+        ok = ok and found == answer
+    database.close()
+    return ok
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else "400000"
+    with tempfile.TemporaryDirectory() as tmp:
+        if source.isdigit():
+            write_synthetic_export(tmp, int(source))
+            source = tmp
+        print("ранжирование:")
+        ranking_ok = check_ranking(tmp)
+        index_path = os.path.join(tmp, "foods.idx")
+
+        start = time.perf_counter()
+        foods, tokens = build_index(read_fdc_export(source), index_path)
+        print(f"построение индекса: {time.perf_counter() - start:.1f} с, {foods} продуктов, {tokens} токенов, "
+              f"{os.path.getsize(index_path) / 1024 / 1024:.1f} МБ на диске")
+
+        before = rss_mb()
+        start = time.perf_counter()
+        database = FoodDatabase(index_path)
+        print(f"открытие (mmap): {(time.perf_counter() - start) * 1000:.2f} мс")
+
+        queries = ["banana", "chicken breast", "rice cooked", "salmon raw", "whole wheat bread", "ban",
+                   "peanut butter", "sweet potato", "yogurt low fat", "nonexistent"]
+        for query in queries:
+            database.lookup(query)
+        rounds = 2000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for query in queries:
+                database.lookup(query)
+        elapsed = time.perf_counter() - start
+        print(f"поиск: {elapsed / (rounds * len(queries)) * 1e6:.0f} мкс на запрос, "
+              f"прирост RSS процесса: {rss_mb() - before:.1f} МБ")
+        for query in ("banana", "chicken breast", "ban"):
+            print(f"  {query!r} -> {database.lookup(query)}")
+        database.close()
+    if not ranking_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Сравнение хранилищ FSM: MemoryStorage из aiogram против SQLite с кэшем и сквозной записью.
+# Имитирует диалог /set_profile: установка состояния и данных на каждом шаге, затем очистка.
+# Запуск: python benchmarks/fsm_storage.py [пользователей] [диалогов]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from fsm_storage import SQLiteStorage  # noqa: E402
+
+STEPS = ("weight", "height", "age", "activity", "city")
+
+
+async def run(storage, users, dialogs):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(dialogs):
+        user_id = random.randrange(users)
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        for step in STEPS:
+            begin = time.perf_counter()
+            await storage.get_state(key)
+            await storage.update_data(key, {step: 1})
+            await storage.set_state(key, f"Form:{step}")
+            latencies.append(time.perf_counter() - begin)
+        await storage.get_data(key)
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+    elapsed = time.perf_counter() - start
+    await storage.close()
+
+    latencies.sort()
+    return {
+        "steps/s": len(latencies) / elapsed,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+# Сборка мусора: сколько времени занимает удаление брошенных диалогов пачками
+def gc_run(path, abandoned):
+    storage = SQLiteStorage(path, ttl=0.0, cache_size=1000, gc_interval=3600, gc_batch=1000)
+    loop = asyncio.new_event_loop()
+    for user_id in range(abandoned):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        loop.run_until_complete(storage.set_state(key, "Form:weight"))
+    begin = time.perf_counter()
+    removed = storage.collect_garbage()
+    elapsed = time.perf_counter() - begin
+    loop.run_until_complete(storage.close())
+    loop.close()
+    return removed, elapsed
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    dialogs = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        candidates = {
+            "memory": MemoryStorage(),
+            "sqlite": SQLiteStorage(os.path.join(tmp, "fsm.db"), ttl=86400, cache_size=50000,
+                                    gc_interval=600, gc_batch=1000),
+        }
+        for name, storage in candidates.items():
+            random.seed(0)
+            result = asyncio.run(run(storage, users, dialogs))
+            print(f"{name:>8}: {result['steps/s']:10.0f} шагов/с, "
+                  f"p50={result['p50_us']:.1f} мкс, p99={result['p99_us']:.1f} мкс")
+
+        removed, elapsed = gc_run(os.path.join(tmp, "gc.db"), users)
+        print(f"{'gc':>8}: удалено {removed} брошенных диалогов за {elapsed * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Пакетный пересчет норм: векторный проход NumPy против цикла по скалярным функциям.
+# Заодно проверяет, что векторные нормы совпадают со скалярными.
+# Запуск: python benchmarks/goals.py [пользователей] [городов]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions import calculate_water_goal, calculate_calorie_goal  # noqa: E402
+from goals import GoalRecalculator  # noqa: E402
+from records import UserRecord  # noqa: E402
+from storage import MemoryUserStore  # noqa: E402
+
+
+# Погода без сети: температура по городам задается напрямую
+class FakeWeather:
+    concurrency = 1
+
+    def __init__(self, temperatures):
+        self.temperatures = temperatures
+
+    def subscribe(self, callback):
+        pass
+
+    def peek(self, city):
+        return self.temperatures.get(city)
+
+
+def make_store(users, cities, temperatures):
+    store = MemoryUserStore()
+    for user_id in range(users):
+        record = UserRecord(random.randint(45, 120), random.randint(150, 200), random.randint(16, 80),
+                            random.randint(0, 120), random.choice(cities))
+        # Нормы считаются по старой погоде, как при настройке профиля
+        record.set("water_goal", calculate_water_goal(record.weight, record.activity, temperatures[record.city]))
+        record.set("calorie_goal", calculate_calorie_goal(record.weight, record.height, record.age, record.activity))
+        store.set(user_id, record)
+    return store
+
+
+def reference(record, temperature):
+    water_goal = calculate_water_goal(record.weight, record.activity, temperature)
+    if temperature is None:
+        water_goal = record.water_goal
+    calorie_goal = calculate_calorie_goal(record.weight, record.height, record.age, record.activity)
+    return water_goal, calorie_goal
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    city_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    random.seed(0)
+
+    cities = [f"city{i}" for i in range(city_count)]
+    old_temperatures = {city: random.uniform(10, 35) for city in cities}
+    new_temperatures = {city: random.uniform(10, 35) for city in cities}
+    # Для части городов погода неизвестна
+    for city in random.sample(cities, city_count // 20):
+        new_temperatures[city] = None
+    store = make_store(users, cities, old_temperatures)
+    # Часть пользователей сменила вес без пересчета норм
+    for user_id in random.sample(range(users), users // 10):
+        store.get(user_id).weight = float(random.randint(45, 120))
+
+    profiles = dict(zip(*store.snapshot()))
+    expected = {user_id: reference(record, new_temperatures[record.city]) for user_id, record in profiles.items()}
+
+    begin = time.perf_counter()
+    scalar_changed = 0
+    for record in profiles.values():
+        goals = reference(record, new_temperatures[record.city])
+        if goals != (record.water_goal, record.calorie_goal):
+            scalar_changed += 1
+    scalar_time = time.perf_counter() - begin
+
+    recalculator = GoalRecalculator(store, FakeWeather(new_temperatures), interval=3600, debounce=0)
+    changed = recalculator.recompute()
+    vector_time = recalculator.last_duration
+
+    mismatches = 0
+    for user_id, goals in expected.items():
+        record = store.get(user_id)
+        actual = (record.water_goal, record.calorie_goal)
+        # Значения как у скалярных функций, типы - фиксированные типы полей записи
+        if actual != goals or type(actual[0]) is not int or type(actual[1]) is not float:
+            mismatches += 1
+
+    print(f"пользователей: {users}, городов: {city_count}")
+    print(f"{'скаляр':>10}: {scalar_time * 1000:8.1f} мс (только расчет), изменилось бы {scalar_changed}")
+    print(f"{'NumPy':>10}: {vector_time * 1000:8.1f} мс (загрузка, расчет и запись), обновлено {changed}")
+    repeated = recalculator.recompute()
+    print(f"{'повтор':>10}: {recalculator.last_duration * 1000:8.1f} мс, обновлено {repeated} (ожидается 0)")
+    print(f"расхождений со скалярной версией: {mismatches}")
+    if mismatches or changed != scalar_changed or repeated:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Сравнение: новая aiohttp-сессия на каждый запрос против общего пула соединений.
+# Запуск: python benchmarks/http_pool.py [кол-во запросов] [параллельность]
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import create_http_session  # noqa: E402
+
+
+# Локальная заглушка внешнего API, считающая открытые TCP-соединения
+async def start_stub_server():
+    connections = set()
+
+    async def handle(request):
+        connections.add(request.transport.get_extra_info("peername"))
+        return web.json_response({"main": {"temp": 21.5}})
+
+    app = web.Application()
+    app.router.add_get("/weather", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/weather", connections
+
+
+async def run(url, requests, concurrency, shared):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    session = create_http_session() if shared else None
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            if shared:
+                async with session.get(url) as response:
+                    await response.json()
+            else:
+                async with aiohttp.ClientSession() as own_session:
+                    async with own_session.get(url) as response:
+                        await response.json()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    if session is not None:
+        await session.close()
+    return elapsed, latencies
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    for shared in (False, True):
+        runner, url, connections = await start_stub_server()
+        elapsed, latencies = await run(url, requests, concurrency, shared)
+        await runner.cleanup()
+        latencies.sort()
+        label = "общий пул" if shared else "сессия на запрос"
+        print(f"{label:>18}: {requests / elapsed:8.0f} req/s, "
+              f"p50={statistics.median(latencies):.2f} мс, "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f} мс, "
+              f"соединений={len(connections)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,257 @@
+# Нагрузочный тест: синтетический трафик Telegram через настоящие Dispatcher и router из bot.py/handlers.py.
+# Bot подменяется сессией, записывающей исходящие вызовы; внешние API - локальными заглушками с задержкой.
+#
+# Запуск: python benchmarks/load_test.py --users 500 --rounds 5 --latency 20 --output results.json
+#         python benchmarks/load_test.py --compare results.json
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Заглушки внешних API слушают на разных loopback-адресах, чтобы метрики различали сервисы
+STUB_HOSTS = {"openweathermap": "127.0.0.2", "fdc": "127.0.0.3", "nutritionix": "127.0.0.4"}
+STUB_PORT = 18080
+CITIES = ["Moscow", "Saint Petersburg", "Kazan", "Sochi", "Novosibirsk", "Yerevan", "Dubai", "Oslo"]
+FOODS = ["banana", "rice", "chicken breast", "apple", "oatmeal", "buckwheat", "salmon", "yogurt"]
+WORKOUTS = ["бег", "ходьба", "плавание", "running", "cycling", "yoga"]
+
+
+def configure_environment(tmp: str):
+    os.environ.setdefault("BOT_TOKEN", "123456:load-test")
+    for key in ("OPENWEATHER_API_KEY", "FOOD_DATA_CENTRAL_API_KEY", "NUTRITIONIX_API_KEY", "NUTRITIONIX_APP_ID"):
+        os.environ[key] = "load-test"
+    os.environ["OPENWEATHER_API_URL"] = f"http://{STUB_HOSTS['openweathermap']}:{STUB_PORT}/data/2.5/weather"
+    os.environ["FOOD_DATA_CENTRAL_API_URL"] = f"http://{STUB_HOSTS['fdc']}:{STUB_PORT}/fdc/v1/foods/search"
+    os.environ["NUTRITIONIX_API_URL"] = f"http://{STUB_HOSTS['nutritionix']}:{STUB_PORT}/v2/natural/exercise"
+    os.environ["METRICS_ENABLED"] = "0"
+    os.environ["THROTTLE_RATES"] = "default:1000000/1"
+    os.environ["UPSTREAM_LIMITS"] = "openweathermap:20/100000,fdc:20/100000,nutritionix:20/100000"
+    os.environ["EVENT_LOG_DIR"] = os.path.join(tmp, "events")
+    os.environ["USER_DB_PATH"] = os.path.join(tmp, "users.db")
+
+
+# Заглушки OpenWeatherMap, FoodData Central и Nutritionix с настраиваемой задержкой
+async def start_stub_servers(latency: float):
+    async def weather(request):
+        await asyncio.sleep(latency)
+        return web.json_response({"main": {"temp": 15 + len(request.query["q"]) % 15}})
+
+    async def food_search(request):
+        await asyncio.sleep(latency)
+        query = request.query["query"]
+        return web.json_response({"foods": [{
+            "description": query.upper(),
+            "foodNutrients": [{"nutrientName": "Protein", "value": 1.1},
+                              {"nutrientName": "Energy", "value": 50 + len(query) * 7}],
+        }]})
+
+    async def exercise(request):
+        await asyncio.sleep(latency)
+        data = await request.json()
+        minutes = int(data["query"].split()[0])
+        return web.json_response({"exercises": [{"nf_calories": data["weight_kg"] * minutes * 0.12}]})
+
+    runners = []
+    for service, host in STUB_HOSTS.items():
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", weather)
+        app.router.add_get("/fdc/v1/foods/search", food_search)
+        app.router.add_post("/v2/natural/exercise", exercise)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, STUB_PORT).start()
+        runners.append(runner)
+    return runners
+
+
+def build_fake_bot():
+    from aiogram import Bot
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage, SendPhoto
+
+    # Сессия Bot API, которая ничего не отправляет, а только записывает вызовы
+    class RecordingSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls = Counter()
+            self._message_ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if isinstance(method, (SendMessage, SendPhoto)):
+                message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                           "chat": {"id": int(method.chat_id), "type": "private"}}
+                if isinstance(method, SendPhoto):
+                    file_id = method.photo if isinstance(method.photo, str) else f"file-{message['message_id']}"
+                    message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 400}]
+                else:
+                    message["text"] = method.text
+                return method.__returning__.model_validate(message, context={"bot": bot})
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            raise NotImplementedError
+            yield b""
+
+        async def close(self):
+            pass
+
+    session = RecordingSession()
+    return Bot(token=os.environ["BOT_TOKEN"], session=session), session
+
+
+# Генератор апдейтов: одна последовательность команд на пользователя
+class TrafficGenerator:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        update_id = next(self._update_ids)
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id)}}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id = next(self._update_ids)
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": self._user(user_id), "chat_instance": "load-test", "data": data,
+            "message": {"message_id": update_id, "date": int(time.time()), "text": "charts",
+                        "chat": {"id": user_id, "type": "private"}}}}
+
+    # Сценарий пользователя: (метка хэндлера, апдейт)
+    def scenario(self, user_id: int, rounds: int, rng: random.Random):
+        profile = [("set_profile", "/set_profile"), ("process_weight", str(rng.randint(50, 110))),
+                   ("process_height", str(rng.randint(150, 200))), ("process_age", str(rng.randint(18, 70))),
+                   ("process_activity", str(rng.choice([0, 30, 45, 60, 90]))),
+                   ("process_city", rng.choice(CITIES))]
+        for label, text in profile:
+            yield label, self.message(user_id, text)
+        for _ in range(rounds):
+            yield "log_water", self.message(user_id, f"/log_water {rng.choice([150, 250, 330, 500])}")
+            yield "log_food", self.message(user_id, f"/log_food {rng.choice(FOODS)}")
+            yield "process_food_weight", self.message(user_id, str(rng.randint(50, 400)))
+            yield "log_workout", self.message(user_id, f"/log_workout {rng.choice(WORKOUTS)} {rng.randint(10, 90)}")
+            yield "check_progress", self.message(user_id, "/check_progress")
+            yield "chart_water", self.callback(user_id, "chart_water")
+            yield "chart_calories", self.callback(user_id, "chart_calories")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(args):
+    from aiogram.types import Update
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        stub_runners = await start_stub_servers(args.latency / 1000)
+
+        import bot as bot_module
+        dp = bot_module.dp
+        fake_bot, session = build_fake_bot()
+        await dp.emit_startup(bot=fake_bot, dispatcher=dp, bots=[fake_bot])
+
+        generator = TrafficGenerator()
+        latencies = defaultdict(list)
+        errors = Counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def simulate_user(user_id: int):
+            rng = random.Random(user_id)
+            async with semaphore:
+                for label, raw in generator.scenario(user_id, args.rounds, rng):
+                    update = Update.model_validate(raw, context={"bot": fake_bot})
+                    start = time.perf_counter()
+                    try:
+                        await dp.feed_update(fake_bot, update)
+                    except Exception as e:
+                        errors[f"{label}:{type(e).__name__}"] += 1
+                    latencies[label].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(simulate_user(100000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - start
+
+        await dp.emit_shutdown(bot=fake_bot, dispatcher=dp, bots=[fake_bot])
+        for runner in stub_runners:
+            await runner.cleanup()
+
+    total = sum(len(values) for values in latencies.values())
+    handlers = {}
+    for label, values in sorted(latencies.items()):
+        values.sort()
+        handlers[label] = {"count": len(values), "p50_ms": percentile(values, 0.5),
+                           "p95_ms": percentile(values, 0.95), "p99_ms": percentile(values, 0.99)}
+    return {
+        "params": vars(args),
+        "updates": total,
+        "seconds": elapsed,
+        "updates_per_sec": total / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "handlers": handlers,
+        "bot_api_calls": dict(session.calls),
+        "errors": dict(errors),
+    }
+
+
+def print_report(result, baseline=None):
+    def delta(current, previous):
+        if previous is None or not previous:
+            return ""
+        return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+    base_handlers = baseline["handlers"] if baseline else {}
+    print(f"апдейтов: {result['updates']}, {result['updates_per_sec']:.0f}/с"
+          f"{delta(result['updates_per_sec'], baseline and baseline['updates_per_sec'])}, "
+          f"пик памяти: {result['peak_rss_mb']:.0f} МБ")
+    print(f"{'хэндлер':<22}{'кол-во':>8}{'p50, мс':>18}{'p95, мс':>18}{'p99, мс':>18}")
+    for label, stats in result["handlers"].items():
+        base = base_handlers.get(label, {})
+        cells = [f"{stats[key]:.2f}{delta(stats[key], base.get(key))}" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{label:<22}{stats['count']:>8}" + "".join(f"{cell:>18}" for cell in cells))
+    print(f"вызовы Bot API: {result['bot_api_calls']}")
+    if result["errors"]:
+        print(f"ошибки: {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5, help="повторов цикла команд на пользователя")
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременно активных пользователей")
+    parser.add_argument("--latency", type=float, default=20, help="задержка заглушек внешних API, мс")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с результатами предыдущего запуска (JSON)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Ежедневный сброс счетчиков: колесо таймеров против задачи asyncio на каждого пользователя.
+# Время моделируется: двое суток шагов колеса проходят без ожидания.
+# Запуск: python benchmarks/rollover.py [пользователей]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from records import UserRecord  # noqa: E402
+from rollover import RolloverScheduler, DayArchive, CITY_TIMEZONES  # noqa: E402
+from storage import MemoryUserStore  # noqa: E402
+
+TICK = 60
+CITIES = list(CITY_TIMEZONES)
+
+
+def make_store(users, scheduler, now):
+    store = scheduler.store
+    for user_id in range(users):
+        record = UserRecord(70, 175, 30, 30, random.choice(CITIES), logged_water=500, logged_calories=1200.0,
+                            burned_calories=300.0)
+        # Бот был выключен: у всех пользователей счетчики за вчерашний день
+        record.day = scheduler.local_day(record, now) - 1
+        store.set(user_id, record)
+
+
+async def wheel_run(users, archive_path):
+    scheduler = RolloverScheduler(MemoryUserStore(), DayArchive(archive_path), TICK, batch=1000)
+    now = time.time()
+    make_store(users, scheduler, now)
+
+    begin = time.perf_counter()
+    await scheduler.recover(now)
+    recover_time = time.perf_counter() - begin
+
+    idle, busy = [], []
+    for step in range(1, 2 * 86400 // TICK + 1):
+        rolled = scheduler.rolled
+        await scheduler.tick(now + step * TICK)
+        (busy if scheduler.rolled > rolled else idle).append(scheduler.last_tick_duration)
+    scheduler.archive.close()
+
+    # Память самого расписания: колесо и сроки пользователей без профилей и архива
+    user_ids, records = scheduler.store.snapshot()
+    fresh = RolloverScheduler(scheduler.store, scheduler.archive, TICK, batch=1000)
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    for user_id, record in zip(user_ids, records):
+        fresh.schedule(user_id, record, now)
+    memory = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(snapshot, "filename"))
+    tracemalloc.stop()
+
+    return {
+        "recovered": scheduler.recovered,
+        "rolled": scheduler.rolled,
+        "archived": len(scheduler.archive.records()),
+        "recover_ms": recover_time * 1000,
+        "idle_tick_us": sum(idle) / len(idle) * 1e6,
+        "busy_tick_ms": max(busy) * 1000,
+        "memory_kb": memory / 1024,
+    }
+
+
+# Наивный вариант: по спящей задаче на пользователя (только память)
+async def tasks_run(users):
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    tasks = [asyncio.ensure_future(asyncio.sleep(86400)) for _ in range(users)]
+    await asyncio.sleep(0)
+    memory = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(snapshot, "filename"))
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return memory / 1024
+
+
+async def main():
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [10000, 100000]
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in sizes:
+            result = await wheel_run(users, os.path.join(tmp, f"days-{users}.log"))
+            print(f"колесо, {users} пользователей: восстановлено {result['recovered']} "
+                  f"за {result['recover_ms']:.0f} мс; за двое суток сброшено {result['rolled']}, "
+                  f"в архиве {result['archived']}")
+            print(f"    пустой шаг {result['idle_tick_us']:.1f} мкс, самый тяжелый шаг "
+                  f"{result['busy_tick_ms']:.1f} мс (пачками по 1000), "
+                  f"память расписания {result['memory_kb']:.0f} КБ")
+            if result["archived"] != result["recovered"] + result["rolled"] or result["rolled"] != 2 * users:
+                sys.exit(1)
+            print(f"задачи, {users} пользователей: память {await tasks_run(users):.0f} КБ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
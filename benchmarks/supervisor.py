@@ -0,0 +1,87 @@
+# Масштабирование многопроцессного режима: пропускная способность по воркерам при разном их числе.
+# Bot API подменяется заглушкой в отдельных процессах, чтобы она не стала узким местом.
+# Запуск: python benchmarks/supervisor.py [апдейтов] [число воркеров через запятую]
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+API_PORT = 18090
+COMMANDS = ["/start", "/help", "/check_progress", "/log_water 250", "/progress_charts"]
+
+
+def fake_api_main():
+    async def handle(request):
+        data = await request.post()
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()), "text": data.get("text", ""),
+            "chat": {"id": int(data.get("chat_id", 1)), "type": "private"}}})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    web.run_app(app, host="127.0.0.1", port=API_PORT, reuse_port=True, print=None, access_log=None)
+
+
+def make_update(update_id: int) -> dict:
+    user = {"id": 1000 + update_id % 5000, "is_bot": False, "first_name": "user"}
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": COMMANDS[update_id % len(COMMANDS)],
+        "chat": {"id": user["id"], "type": "private"}, "from": user}}
+
+
+async def run(workers: int, total: int):
+    from supervisor import Supervisor
+
+    supervisor = Supervisor(workers)
+    supervisor.start()
+    # Ждем, пока воркеры прогреются (импорт и запуск диспетчера)
+    warmup = 20
+    for i in range(workers * warmup):
+        await supervisor.route(make_update(i))
+    while sum(supervisor.processed) < workers * warmup:
+        await asyncio.sleep(0.1)
+
+    before = list(supervisor.processed)
+    start = time.perf_counter()
+    for i in range(total):
+        await supervisor.route(make_update(workers * warmup + i))
+    while sum(supervisor.processed) - sum(before) < total:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    per_worker = [(after - prior) / elapsed for after, prior in zip(supervisor.processed, before)]
+    await asyncio.get_running_loop().run_in_executor(None, supervisor.stop)
+    return total / elapsed, per_worker
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    variants = [int(n) for n in (sys.argv[2] if len(sys.argv) > 2 else "1,2,4").split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            "BOT_TOKEN": "123456:supervisor-bench", "TELEGRAM_API_URL": f"http://127.0.0.1:{API_PORT}",
+            "METRICS_ENABLED": "0", "THROTTLE_RATES": "default:1000000/1", "EVENT_LOG_DIR": tmp,
+        })
+        context = multiprocessing.get_context("spawn")
+        api_processes = [context.Process(target=fake_api_main, daemon=True) for _ in range(max(variants))]
+        for process in api_processes:
+            process.start()
+        time.sleep(2)
+        try:
+            for workers in variants:
+                rate, per_worker = asyncio.run(run(workers, total))
+                print(f"воркеров: {workers}: {rate:6.0f} апд/с всего; по воркерам: "
+                      + ", ".join(f"{value:.0f}" for value in per_worker))
+        finally:
+            for process in api_processes:
+                process.terminate()
+
+
+if __name__ == "__main__":
+    main()
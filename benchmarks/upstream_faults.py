@@ -0,0 +1,211 @@
+# Устойчивость вызовов внешних API к сбоям: локальная заглушка с внедрением задержек, 5xx и зависаний.
+# Настоящие search_food / fetch_nutritionix_rate и кэш продуктов ходят в заглушку через слой Upstream (http_client.py):
+# медленный хвост с дублирующими запросами и без, 5xx с повторами и без, зависание и размыкатель цепи,
+# последнее известное значение из кэша, POST без повторов.
+# Запуск: python benchmarks/upstream_faults.py
+import asyncio
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_PORT = 18097
+os.environ.setdefault("BOT_TOKEN", "123456:upstream-faults")
+os.environ["METRICS_ENABLED"] = "0"
+for key in ("FOOD_DATA_CENTRAL_API_KEY", "NUTRITIONIX_API_KEY", "NUTRITIONIX_APP_ID"):
+    os.environ[key] = "upstream-faults"
+os.environ["FOOD_DATA_CENTRAL_API_URL"] = f"http://127.0.0.1:{STUB_PORT}/fdc/v1/foods/search"
+os.environ["NUTRITIONIX_API_URL"] = f"http://127.0.0.1:{STUB_PORT}/v2/natural/exercise"
+
+import http_client  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from functions import search_food  # noqa: E402
+from http_client import CircuitBreaker, Upstream, UpstreamError, UpstreamLimiter, create_http_session  # noqa: E402
+from records import UserRecord  # noqa: E402
+from workouts import fetch_nutritionix_rate  # noqa: E402
+
+
+# Заглушка FoodData Central и Nutritionix: задержка, доля медленных ответов, доля 5xx и режим зависания
+class FaultyServer:
+    def __init__(self):
+        self.runner = None
+        self.reset()
+
+    async def _respond(self, payload):
+        self.requests += 1
+        if self.hang:
+            await asyncio.sleep(3600)
+        slow = self.rng.random() < self.slow_rate
+        await asyncio.sleep(self.slow_latency if slow else self.latency)
+        if self.rng.random() < self.error_rate:
+            return web.json_response({"error": "injected"}, status=503)
+        return web.json_response(payload)
+
+    async def food_search(self, request):
+        query = request.query["query"]
+        return await self._respond({"foods": [{
+            "description": query, "foodNutrients": [{"nutrientName": "Energy", "value": 50 + len(query)}]}]})
+
+    async def exercise(self, request):
+        return await self._respond({"exercises": [{"nf_calories": 300.0, "duration_min": 30}]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/fdc/v1/foods/search", self.food_search)
+        app.router.add_post("/v2/natural/exercise", self.exercise)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", STUB_PORT).start()
+
+    def reset(self, latency=0.02, slow_rate=0.0, slow_latency=1.0, error_rate=0.0, hang=False):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.hang = hang
+        self.requests = 0
+        self.rng = random.Random(1)
+
+
+def install(service: str, deadline=2.0, retries=2, backoff=0.05, threshold=5, reset_timeout=1.0, hedge=False):
+    upstream = Upstream(service, UpstreamLimiter(service, 50, 1000), deadline, retries, backoff,
+                        CircuitBreaker(threshold, reset_timeout), hedge)
+    http_client.upstreams[service] = upstream
+    return upstream
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# count вызовов search_food с ограниченной параллельностью: задержки успешных вызовов и число ошибок
+async def search_many(session, count: int, concurrency: int = 10):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await search_food(f"food {i % 50}", session)
+                latencies.append(time.perf_counter() - start)
+            except UpstreamError:
+                errors += 1
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, errors
+
+
+async def main():
+    server = FaultyServer()
+    await server.start()
+    session = create_http_session()
+    failed = []
+
+    def check(ok: bool, message: str):
+        print(f"  {'OK' if ok else 'ОШИБКА'}: {message}")
+        if not ok:
+            failed.append(message)
+
+    # Медленный хвост: 5% ответов идут 1 с. Дублирующий запрос после p95 срезает хвост
+    print("медленный хвост (5% ответов по 1 с):")
+    tails = {}
+    for hedge in (False, True):
+        server.reset(slow_rate=0.05)
+        upstream = install("fdc", hedge=hedge)
+        await search_many(session, 100)  # набор статистики задержек для p95
+        latencies, errors = await search_many(session, 400)
+        tails[hedge] = percentile(latencies, 0.99)
+        print(f"  {'с дублированием' if hedge else 'без дублирования':>17}: p50 {percentile(latencies, 0.5) * 1000:5.0f} мс, "
+              f"p99 {tails[hedge] * 1000:5.0f} мс, дублей {upstream.hedged}, запросов к заглушке {server.requests}")
+    check(tails[True] < tails[False] / 2, "дублирование снижает p99 больше чем вдвое")
+
+    # Медленный, но исправный сервис: ответ за 0.8 с при предельном времени 2 с приходит с первой попытки
+    print("медленный исправный сервис (ответ 0.8 с, предельное время 2 с):")
+    server.reset(latency=0.8)
+    upstream = install("fdc")
+    latencies, errors = await search_many(session, 20)
+    check(errors == 0 and upstream.retried == 0 and upstream.timeouts == 0 and upstream.breaker.failures == 0,
+          f"все вызовы успешны без повторов и сбоев цепи (запросов к заглушке {server.requests})")
+
+    # 30% ответов - 503. Повторы GET со случайной паузой почти всегда доводят вызов до успеха
+    print("30% ответов 503:")
+    success = {}
+    for retries in (0, 2):
+        server.reset(error_rate=0.3)
+        upstream = install("fdc", retries=retries, threshold=1000)
+        latencies, errors = await search_many(session, 400)
+        success[retries] = len(latencies) / 400
+        print(f"  {'повторов ' + str(retries):>17}: успешных {success[retries] * 100:5.1f}%, повторов {upstream.retried}, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f} мс")
+    check(success[2] > 0.95, "с двумя повторами успешно более 95% вызовов")
+
+    # Зависание: вызов ограничен предельным временем, после 5 неудач цепь размыкается и вызовы сразу отклоняются
+    print("зависание сервиса (предельное время 0.5 с, размыкание после 5 неудач на 1 с):")
+    server.reset(hang=True)
+    upstream = install("fdc", deadline=0.5, reset_timeout=1.0)
+    slowest = 0.0
+    for i in range(5):
+        start = time.perf_counter()
+        try:
+            await search_food("bread", session)
+        except UpstreamError:
+            pass
+        slowest = max(slowest, time.perf_counter() - start)
+    check(slowest < 0.6, f"вызов при зависании занимает не больше предельного времени ({slowest * 1000:.0f} мс)")
+    before = server.requests
+    start = time.perf_counter()
+    _, errors = await search_many(session, 100)
+    elapsed = time.perf_counter() - start
+    check(upstream.breaker.state == CircuitBreaker.OPEN and server.requests == before and errors == 100,
+          f"цепь разомкнута: 100 вызовов отклонены за {elapsed * 1000:.1f} мс без запросов к сервису")
+    server.hang = False
+    await asyncio.sleep(1.1)
+    # Пока идет единственный пробный вызов, остальные по-прежнему отклоняются
+    probe = asyncio.ensure_future(search_food("bread", session))
+    await asyncio.sleep(0)
+    _, rejected = await search_many(session, 10)
+    await probe
+    latencies, errors = await search_many(session, 50)
+    check(rejected == 10 and upstream.breaker.state == CircuitBreaker.CLOSED and errors == 0,
+          f"после восстановления один пробный вызов замыкает цепь (размыканий: {upstream.breaker.opens})")
+
+    # Последнее известное значение: запись кэша устарела, сервис завис - отдается старое значение, а не ошибка
+    print("последнее известное значение:")
+    server.reset()
+    install("fdc", deadline=0.5)
+    cache = TTLCache(100, 0.1)
+    fresh = await cache.get_or_fetch("apple", lambda: search_food("apple", session))
+    await asyncio.sleep(0.2)
+    server.hang = True
+    start = time.perf_counter()
+    stale = await cache.get_or_fetch("apple", lambda: search_food("apple", session))
+    check(stale == fresh and cache.stale_hits == 1,
+          f"устаревшее значение {stale} отдано за {(time.perf_counter() - start) * 1000:.0f} мс")
+
+    # POST Nutritionix не повторяется: один запрос к сервису на вызов даже при 5xx
+    print("POST без повторов:")
+    server.reset(error_rate=1.0)
+    install("nutritionix", threshold=1000)
+    user = UserRecord(70.0, 175, 30, 30, "Moscow")
+    for _ in range(20):
+        try:
+            await fetch_nutritionix_rate("rowing", user, 30, session)
+        except UpstreamError:
+            pass
+    check(server.requests == 20, f"20 вызовов - {server.requests} запросов к сервису")
+
+    await session.close()
+    await server.runner.cleanup()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
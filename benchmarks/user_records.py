@@ -0,0 +1,101 @@
+# Память на пользователя и стоимость доступа: словарь (старый формат), UserRecord со слотами
+# и столбцовое хранилище NumPy. Запуск: python benchmarks/user_records.py [пользователей]
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from records import UserRecord  # noqa: E402
+from storage import MemoryUserStore, ColumnarUserStore  # noqa: E402
+
+CITIES = ["Moscow", "Saint Petersburg", "Kazan", "Sochi", "Novosibirsk", "Yerevan", "Dubai", "Oslo"]
+
+
+def make_values(user_id):
+    return (random.randint(45, 120), random.randint(150, 200), random.randint(16, 80), random.randint(0, 120),
+            random.choice(CITIES))
+
+
+# Профиль в старом формате: данные FSM, слитые со счетчиками
+def make_dict(values):
+    weight, height, age, activity, city = values
+    return {"weight": weight, "height": height, "age": age, "activity": activity, "city": city,
+            "timezone": "Europe/Moscow", "water_goal": weight * 30 + 500, "calorie_goal": 10 * weight + 6.25 * height,
+            "logged_water": random.randint(0, 3000), "logged_calories": random.uniform(0, 2500),
+            "burned_calories": random.uniform(0, 800), "day": 20000}
+
+
+def make_record(values):
+    data = make_dict(values)
+    return UserRecord.from_dict(data)
+
+
+def measure_memory(build, users):
+    random.seed(0)
+    values = [make_values(user_id) for user_id in range(users)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build(values)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, (after - before) / users
+
+
+def build_dicts(values):
+    return {user_id: make_dict(value) for user_id, value in enumerate(values)}
+
+
+def build_memory(values):
+    store = MemoryUserStore()
+    for user_id, value in enumerate(values):
+        store.set(user_id, make_record(value))
+    return store
+
+
+def build_columnar(values):
+    store = ColumnarUserStore()
+    for user_id, value in enumerate(values):
+        store.set(user_id, make_record(value))
+    return store
+
+
+# Типичный путь хэндлера: прочитать профиль, увеличить счетчик, посчитать остаток
+def access_dicts(store, user_ids):
+    for user_id in user_ids:
+        record = store[user_id]
+        record["logged_water"] += 250
+        max(0, record["water_goal"] - record["logged_water"])
+
+
+def access_store(store, user_ids):
+    for user_id in user_ids:
+        record = store.increment(user_id, "logged_water", 250)
+        max(0, record.water_goal - record.logged_water)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    operations = 200000
+    candidates = [
+        ("dict", build_dicts, access_dicts),
+        ("UserRecord", build_memory, access_store),
+        ("columnar", build_columnar, access_store),
+    ]
+    for name, build, access in candidates:
+        store, per_user = measure_memory(build, users)
+        user_ids = [random.randrange(users) for _ in range(operations)]
+        begin = time.perf_counter()
+        access(store, user_ids)
+        elapsed = time.perf_counter() - begin
+        print(f"{name:>10}: {per_user:6.0f} байт на пользователя, "
+              f"{elapsed / operations * 1e9:6.0f} нс на обращение (чтение + увеличение счетчика)")
+        del store
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
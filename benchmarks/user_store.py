@@ -0,0 +1,61 @@
+# Сравнение хранилищ пользователей: записи в памяти против SQLite с отложенной записью.
+# Запуск: python benchmarks/user_store.py [пользователей] [команд]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from records import UserRecord  # noqa: E402
+from storage import MemoryUserStore, SQLiteUserStore  # noqa: E402
+
+
+def make_profile():
+    return UserRecord(70, 175, 30, 30, "Moscow", water_goal=2600, calorie_goal=2000)
+
+
+async def run(store, users, commands):
+    for user_id in range(users):
+        store.set(user_id, make_profile())
+    await store.start()
+
+    fields = ("logged_water", "logged_calories", "burned_calories")
+    latencies = []
+    start = time.perf_counter()
+    for i in range(commands):
+        user_id = random.randrange(users)
+        begin = time.perf_counter()
+        record = store.increment(user_id, random.choice(fields), 250)
+        max(0, record.water_goal - record.logged_water)
+        latencies.append(time.perf_counter() - begin)
+        # Отдаем управление циклу событий, как между обработкой апдейтов
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    await store.close()
+
+    latencies.sort()
+    return commands / elapsed, latencies[int(len(latencies) * 0.99)] * 1e6
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    commands = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {
+            "memory": MemoryUserStore(),
+            "sqlite": SQLiteUserStore(os.path.join(tmp, "users.db"), flush_interval=0.05, cache_size=users),
+            "sqlite (cold cache)": SQLiteUserStore(os.path.join(tmp, "cold.db"), flush_interval=0.05,
+                                                   cache_size=users // 10),
+        }
+        for name, store in stores.items():
+            rate, p99 = await run(store, users, commands)
+            extra = f", транзакций={store.flushes}" if isinstance(store, SQLiteUserStore) else ""
+            print(f"{name:>20}: {rate:10.0f} записей/с, p99={p99:.1f} мкс{extra}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
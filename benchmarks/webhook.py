@@ -0,0 +1,149 @@
+# Сравнение режимов получения апдейтов: long polling против вебхука на локальной заглушке Bot API.
+# Запуск: python benchmarks/webhook.py [апдейтов] [задержка сети, мс]
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from webhook import create_webhook_app  # noqa: E402
+
+SECRET = "benchmark-secret"
+
+
+def make_update(update_id: int) -> dict:
+    user = {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "user"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": str(update_id),
+        },
+    }
+
+
+# Заглушка Bot API: отдает апдейты через getUpdates и фиксирует время ответов бота
+class FakeBotApi:
+    def __init__(self, total: int, rtt: float):
+        self.total = total
+        self.rtt = rtt
+        self.pending = []
+        self.sent_at = {}
+        self.answered_at = {}
+        self.done = asyncio.Event()
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        await asyncio.sleep(self.rtt)
+        if method == "getUpdates":
+            batch, self.pending = self.pending[:100], self.pending[100:]
+            now = time.perf_counter()
+            for update in batch:
+                self.sent_at[update["update_id"]] = now
+            return web.json_response({"ok": True, "result": batch})
+        if method == "sendMessage":
+            update_id = int(data["text"])
+            self.answered_at[update_id] = time.perf_counter()
+            if len(self.answered_at) == self.total:
+                self.done.set()
+            return web.json_response({"ok": True, "result": {
+                "message_id": update_id, "date": int(time.time()), "text": data["text"],
+                "chat": {"id": int(data["chat_id"]), "type": "private"}}})
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bot"}})
+        return web.json_response({"ok": True, "result": True})
+
+    def latencies(self):
+        return sorted((self.answered_at[i] - self.sent_at[i]) * 1000 for i in self.answered_at)
+
+
+async def start_app(app: web.Application):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+def make_bot_and_dispatcher(api_port: int):
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}"))
+    bot = Bot(token="123456:benchmark", session=session)
+    dp = Dispatcher()
+
+    @dp.message()
+    async def echo(message: Message):
+        await message.answer(message.text)
+
+    return bot, dp
+
+
+async def bench_polling(total: int, rtt: float):
+    api = FakeBotApi(total, rtt)
+    api.pending = [make_update(i) for i in range(1, total + 1)]
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    api_runner, api_port = await start_app(app)
+    bot, dp = make_bot_and_dispatcher(api_port)
+
+    start = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    await api.done.wait()
+    elapsed = time.perf_counter() - start
+    await dp.stop_polling()
+    await polling
+    await api_runner.cleanup()
+    return total / elapsed, api.latencies()
+
+
+async def bench_webhook(total: int, rtt: float, concurrency: int = 100):
+    api = FakeBotApi(total, rtt)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    api_runner, api_port = await start_app(app)
+    bot, dp = make_bot_and_dispatcher(api_port)
+    webhook_runner, webhook_port = await start_app(create_webhook_app(dp, bot, secret_token=SECRET))
+
+    url = f"http://127.0.0.1:{webhook_port}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(session, update):
+        async with semaphore:
+            api.sent_at[update["update_id"]] = time.perf_counter()
+            await asyncio.sleep(rtt)
+            async with session.post(url, json=update, headers=headers) as response:
+                assert response.status == 200, response.status
+
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(post(session, make_update(i)) for i in range(1, total + 1)))
+    await api.done.wait()
+    elapsed = time.perf_counter() - start
+    await webhook_runner.cleanup()
+    await api_runner.cleanup()
+    return total / elapsed, api.latencies()
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+
+    for name, bench in (("polling", bench_polling), ("webhook", bench_webhook)):
+        rate, latencies = await bench(total, rtt)
+        print(f"{name:>8}: {rate:8.0f} апдейтов/с, p50={statistics.median(latencies):.1f} мс, "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1]:.1f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+# Сравнение локальной оценки калорий (таблица MET) с ответами Nutritionix на наборе тренировок.
+# Сначала ответы API записываются один раз: --record (нужны NUTRITIONIX_APP_ID и NUTRITIONIX_API_KEY) отправляет
+# набор WORKOUTS в Nutritionix и сохраняет ответы в fixtures/nutritionix_workouts.json. Дальше сравнение идет офлайн:
+# записанные ответы отдает локальная заглушка, через которую идет настоящий fetch_nutritionix_rate.
+# Запуск: python benchmarks/workouts_compare.py [--record]
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURE_PATH = os.path.join(ROOT, "benchmarks", "fixtures", "nutritionix_workouts.json")
+STUB_PORT = 18098
+RECORD = "--record" in sys.argv
+
+# Набор тренировок: (тренировка, минуты, вес, рост, возраст)
+WORKOUTS = [
+    ("бег", 30, 70, 175, 30),
+    ("running", 45, 85, 182, 40),
+    ("ходьба", 60, 60, 165, 25),
+    ("плавание", 40, 75, 178, 35),
+    ("велосипед", 60, 80, 180, 45),
+    ("йога", 60, 55, 160, 28),
+    ("силовая", 50, 90, 185, 32),
+    ("танцы", 30, 58, 168, 22),
+    ("теннис", 60, 72, 176, 50),
+    ("скакалка", 15, 65, 170, 27),
+]
+
+if not RECORD:
+    os.environ["NUTRITIONIX_API_URL"] = f"http://127.0.0.1:{STUB_PORT}/v2/natural/exercise"
+    for key in ("NUTRITIONIX_API_KEY", "NUTRITIONIX_APP_ID"):
+        os.environ[key] = "fixture"
+
+from config import NUTRITIONIX_API_KEY, NUTRITIONIX_APP_ID, NUTRITIONIX_API_URL  # noqa: E402
+from http_client import create_http_session  # noqa: E402
+from records import UserRecord  # noqa: E402
+from workouts import ACTIVITY_SYNONYMS, local_workout_calories, fetch_nutritionix_rate  # noqa: E402
+
+
+def load_fixture() -> dict:
+    if not os.path.exists(FIXTURE_PATH):
+        sys.exit(f"Нет записанных ответов Nutritionix ({FIXTURE_PATH}): запустите с --record")
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fixture_user(entry) -> UserRecord:
+    return UserRecord(float(entry["weight"]), entry["height"], entry["age"], 0, "")
+
+
+# Заглушка Nutritionix: ответ из фикстуры по тексту запроса
+async def start_fixture_api(entries):
+    responses = {f"{entry['minutes']} minutes of {ACTIVITY_SYNONYMS[entry['activity']]}": entry["response"]
+                 for entry in entries}
+
+    async def exercise(request):
+        data = await request.json()
+        response = responses.get(data["query"])
+        if response is None:
+            return web.json_response({"message": "not in fixture"}, status=404)
+        return web.json_response(response)
+
+    app = web.Application()
+    app.router.add_post("/v2/natural/exercise", exercise)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", STUB_PORT).start()
+    return runner
+
+
+# Запись ответов API в фикстуру (те же запросы, что отправляет бот)
+async def record():
+    if not (NUTRITIONIX_API_KEY and NUTRITIONIX_APP_ID):
+        sys.exit("Для --record нужны NUTRITIONIX_APP_ID и NUTRITIONIX_API_KEY")
+    from workouts import NUTRITIONIX_HEADERS
+
+    fixture = {"entries": [{"activity": activity, "minutes": minutes, "weight": weight, "height": height, "age": age}
+                           for activity, minutes, weight, height, age in WORKOUTS]}
+    async with create_http_session() as session:
+        for entry in fixture["entries"]:
+            user = fixture_user(entry)
+            request_data = {"query": f"{entry['minutes']} minutes of {ACTIVITY_SYNONYMS[entry['activity']]}",
+                            "weight_kg": user.weight, "height_cm": user.height, "age": user.age}
+            async with session.post(NUTRITIONIX_API_URL, headers=NUTRITIONIX_HEADERS, json=request_data) as response:
+                response.raise_for_status()
+                entry["response"] = await response.json()
+    os.makedirs(os.path.dirname(FIXTURE_PATH), exist_ok=True)
+    with open(FIXTURE_PATH, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=2)
+    print(f"записано ответов: {len(fixture['entries'])} -> {FIXTURE_PATH}")
+
+
+async def compare(fixture):
+    runner = await start_fixture_api(fixture["entries"])
+    errors = []
+    print(f"{'тренировка':<12}{'мин':>5}{'кг':>5}{'MET, ккал':>12}{'API, ккал':>12}{'разница':>10}")
+    try:
+        async with create_http_session() as session:
+            for entry in fixture["entries"]:
+                user = fixture_user(entry)
+                minutes = entry["minutes"]
+                local = local_workout_calories(entry["activity"], user.weight, minutes)
+                rate = await fetch_nutritionix_rate(ACTIVITY_SYNONYMS[entry["activity"]], user, minutes, session)
+                api = rate * user.weight * minutes
+                errors.append(abs(local - api) / api)
+                print(f"{entry['activity']:<12}{minutes:>5}{entry['weight']:>5}{local:>12.1f}{api:>12.1f}"
+                      f"{(local - api) / api * 100:>9.0f}%")
+    finally:
+        await runner.cleanup()
+
+    print(f"средняя относительная разница: {sum(errors) / len(errors) * 100:.1f}%")
+
+
+def main():
+    asyncio.run(record() if RECORD else compare(load_fixture()))
+
+
+if __name__ == "__main__":
+    main()
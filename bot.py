@@ -1,18 +1,86 @@
 import asyncio
 from aiogram import Bot, Dispatcher
-from config import TOKEN
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import TOKEN, RUN_MODE, TELEGRAM_API_URL
 from handlers import router
-from middlewares import LoggingMiddleware
+from http_client import on_startup as http_startup, on_shutdown as http_shutdown
+from cache import on_startup as weather_startup, on_shutdown as weather_shutdown
+from charts import on_startup as charts_startup, on_shutdown as charts_shutdown
+from goals import goal_recalculator, on_startup as goals_startup, on_shutdown as goals_shutdown
+from storage import on_startup as store_startup, on_shutdown as store_shutdown
+from events import on_startup as events_startup, on_shutdown as events_shutdown
+from rollover import rollover_scheduler, on_startup as rollover_startup, on_shutdown as rollover_shutdown
+from broadcast import broadcaster, on_startup as broadcast_startup, on_shutdown as broadcast_shutdown
+from reminders import water_reminders, on_startup as reminders_startup, on_shutdown as reminders_shutdown
+from food_db import on_startup as food_db_startup, on_shutdown as food_db_shutdown
+from fsm_storage import SQLiteStorage, create_fsm_storage, on_startup as fsm_startup
+from middlewares import MetricsMiddleware, ThrottlingMiddleware
+from metrics import register_stats, on_startup as metrics_startup, on_shutdown as metrics_shutdown
+from cache import food_cache, weather_cache, chart_cache
+from charts import chart_renderer
+from http_client import upstreams
 
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
+bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+dp = Dispatcher(storage=create_fsm_storage())
 dp.include_router(router)
-dp.message.middleware(LoggingMiddleware())
+
+# Метрики хэндлеров и ограничение частоты команд (одно состояние ведер для сообщений и нажатий кнопок)
+throttling = ThrottlingMiddleware()
+for observer in (dp.message, dp.callback_query):
+    observer.middleware(MetricsMiddleware())
+    observer.middleware(throttling)
+
+# Показатели компонентов для /metrics
+register_stats("food_cache", food_cache.stats)
+register_stats("weather_cache", weather_cache.stats)
+register_stats("chart_cache", chart_cache.stats)
+register_stats("chart_renderer", chart_renderer.stats)
+register_stats("goals", goal_recalculator.stats)
+register_stats("rollover", rollover_scheduler.stats)
+register_stats("broadcast", broadcaster.stats)
+register_stats("reminders", water_reminders.stats)
+register_stats("throttling", throttling.stats)
+if isinstance(dp.storage, SQLiteStorage):
+    register_stats("fsm_storage", dp.storage.stats)
+for service, upstream in upstreams.items():
+    register_stats(f"upstream_{service}", upstream.stats)
+
+# Эндпоинт метрик, хранилища пользователей и FSM, журнал событий, ежедневный сброс счетчиков,
+# рассылка напоминаний, офлайн-база продуктов, общий HTTP-клиент, фоновое обновление погоды, пересчет норм и пул графиков
+# живут вместе с диспетчером
+dp.startup.register(metrics_startup)
+dp.startup.register(store_startup)
+dp.startup.register(fsm_startup)
+dp.startup.register(events_startup)
+dp.startup.register(rollover_startup)
+dp.startup.register(broadcast_startup)
+dp.startup.register(reminders_startup)
+dp.startup.register(food_db_startup)
+dp.startup.register(http_startup)
+dp.startup.register(weather_startup)
+dp.startup.register(goals_startup)
+dp.startup.register(charts_startup)
+dp.shutdown.register(charts_shutdown)
+dp.shutdown.register(goals_shutdown)
+dp.shutdown.register(weather_shutdown)
+dp.shutdown.register(http_shutdown)
+dp.shutdown.register(food_db_shutdown)
+dp.shutdown.register(reminders_shutdown)
+dp.shutdown.register(broadcast_shutdown)
+dp.shutdown.register(rollover_shutdown)
+dp.shutdown.register(events_shutdown)
+dp.shutdown.register(store_shutdown)
+dp.shutdown.register(metrics_shutdown)
 
 
 async def main():
     print("Бот запущен!")
-    await dp.start_polling(bot)
+    if RUN_MODE == "webhook":
+        from webhook import run_webhook
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+from config import (BROADCAST_GLOBAL_RATE, BROADCAST_CHAT_RATE, BROADCAST_CONCURRENCY, BROADCAST_DIR, WORKERS,
+                    WORKER_INDEX)
+
+# Попыток отправки при сетевых ошибках и ошибках сервера (retry_after попыткой не считается)
+NETWORK_ATTEMPTS = 3
+
+
+# Ведро токенов с резервированием: вызывающий получает время, которое нужно подождать до отправки
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+# Задание рассылки: получатели пишутся один раз, прогресс - отдельным маленьким файлом.
+# Прогресс - позиция, до которой все отправлено, и номера уже отправленных сообщений после нее.
+class BroadcastJob:
+    def __init__(self, directory: str, job_id: str, kind: str, targets, cursor: int = 0, done=()):
+        self.directory = directory
+        self.job_id = job_id
+        self.kind = kind
+        self.targets = targets
+        self.cursor = cursor
+        self.done = set(done)
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.job_id}.{suffix}")
+
+    def _write(self, suffix: str, payload):
+        path = self._path(suffix)
+        with open(path + ".tmp", "w") as f:
+            json.dump(payload, f)
+        os.replace(path + ".tmp", path)
+
+    def create(self):
+        self._write("job", {"kind": self.kind, "targets": self.targets})
+        self.save()
+
+    def save(self):
+        self._write("progress", {"cursor": self.cursor, "done": sorted(self.done)})
+
+    def remove(self):
+        for suffix in ("job", "progress"):
+            try:
+                os.remove(self._path(suffix))
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def load(cls, directory: str, job_id: str):
+        with open(os.path.join(directory, f"{job_id}.job")) as f:
+            job = json.load(f)
+        try:
+            with open(os.path.join(directory, f"{job_id}.progress")) as f:
+                progress = json.load(f)
+        except FileNotFoundError:
+            progress = {"cursor": 0, "done": []}
+        return cls(directory, job_id, job["kind"], job["targets"], progress["cursor"], progress["done"])
+
+    def pending(self):
+        return (index for index in range(self.cursor, len(self.targets)) if index not in self.done)
+
+    def mark_done(self, index: int):
+        self.done.add(index)
+        while self.cursor in self.done:
+            self.done.remove(self.cursor)
+            self.cursor += 1
+
+
+# Рассылка с учетом лимитов Telegram: общий лимит и лимит на чат через ведра токенов,
+# пауза всех отправок по retry_after и сохранение прогресса заданий на диск
+class Broadcaster:
+    def __init__(self, directory: str, global_rate: float, chat_rate: float, concurrency: int,
+                 save_interval: float = 1.0):
+        self.directory = directory
+        self.concurrency = concurrency
+        self.save_interval = save_interval
+        self.chat_rate = chat_rate
+        # Без запаса на всплеск: Telegram считает лимит по скользящему окну
+        self._global = TokenBucket(global_rate, 1)
+        self._chats = {}  # chat_id -> TokenBucket (только на время задания)
+        self._paused_until = 0.0
+        self._renderers = {}
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+        self.jobs_done = 0
+        self.jobs_failed = 0
+
+    # Текст сообщения по типу задания: render(chat_id) -> str или None (не отправлять)
+    def register(self, kind: str, render):
+        self._renderers[kind] = render
+
+    def submit(self, kind: str, targets) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = f"{time.time_ns()}-{kind}"
+        job = BroadcastJob(self.directory, job_id, kind, list(targets))
+        job.create()
+        self._queue.put_nowait(job)
+        return job_id
+
+    # Незавершенные задания с прошлого запуска в порядке создания
+    def resume(self):
+        if not os.path.isdir(self.directory):
+            return 0
+        job_ids = sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith(".job"))
+        for job_id in job_ids:
+            self._queue.put_nowait(BroadcastJob.load(self.directory, job_id))
+        return len(job_ids)
+
+    async def _wait_turn(self, chat_id: int):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, 1)
+            delay = max(self._global.reserve(now), bucket.reserve(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # За время ожидания Telegram мог попросить паузу
+            if time.monotonic() >= self._paused_until:
+                return
+
+    async def _send(self, bot, chat_id: int, text: str) -> bool:
+        attempts = 0
+        while True:
+            await self._wait_turn(chat_id)
+            try:
+                await bot.send_message(chat_id, text)
+                return True
+            except TelegramRetryAfter as e:
+                # Лимит превышен: останавливаем все отправки, а не только этот чат
+                self.retries += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except (TelegramNetworkError, TelegramServerError):
+                attempts += 1
+                self.retries += 1
+                if attempts >= NETWORK_ATTEMPTS:
+                    return False
+                await asyncio.sleep(attempts)
+            except TelegramAPIError:
+                # Бот заблокирован или чат недоступен - повторять бесполезно
+                return False
+
+    async def run_job(self, bot, job: BroadcastJob):
+        render = self._renderers[job.kind]
+        pending = job.pending()
+
+        async def worker():
+            for index in pending:
+                chat_id = job.targets[index]
+                try:
+                    text = render(chat_id)
+                    if text is None:
+                        self.skipped += 1
+                    elif await self._send(bot, chat_id, text):
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+                except Exception as e:
+                    # Ошибка одного сообщения не останавливает остальных получателей
+                    print(f"Рассылка {job.job_id}: ошибка для чата {chat_id}: {e!r}")
+                    self.failed += 1
+                job.mark_done(index)
+
+        async def saver():
+            while True:
+                await asyncio.sleep(self.save_interval)
+                job.save()
+
+        saving = asyncio.ensure_future(saver())
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            saving.cancel()
+            job.save()
+        job.remove()
+        self._chats.clear()
+        self.jobs_done += 1
+
+    async def run(self, bot):
+        self.resume()
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.run_job(bot, job)
+            except Exception as e:
+                # Например, OSError при сохранении прогресса: задание остается на диске и продолжится
+                # после перезапуска, следующие задания рассылаются как обычно
+                print(f"Ошибка рассылки {job.job_id}: {e!r}")
+                self._chats.clear()
+                self.jobs_failed += 1
+
+    def start(self, bot):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+        }
+
+
+# Под супервизором каждый воркер рассылает своим пользователям: общий лимит Telegram делится между воркерами
+broadcaster = Broadcaster(BROADCAST_DIR, BROADCAST_GLOBAL_RATE / (WORKERS if WORKER_INDEX >= 0 else 1),
+                          BROADCAST_CHAT_RATE, BROADCAST_CONCURRENCY)
+
+
+# Рассылки отправляются от имени бота, переданного диспетчером
+async def on_startup(bot):
+    broadcaster.start(bot)
+
+
+async def on_shutdown():
+    await broadcaster.stop()
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from config import (FOOD_CACHE_SIZE, FOOD_CACHE_TTL, CHART_CACHE_SIZE, CHART_CACHE_TTL, WEATHER_CACHE_TTL, WEATHER_REFRESH_INTERVAL,
+                    WEATHER_REFRESH_CONCURRENCY, WEATHER_CITY_IDLE_TTL)
+from functions import get_temperature
+
+_MISSING = object()
+
+
+# Ограниченный по размеру LRU-кэш с временем жизни записей и объединением одновременных запросов
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    # Получение значения; просроченные записи возвращаются только при allow_stale
+    def get(self, key, default=None, allow_stale=False):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic() and not allow_stale:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    # Получение значения с учетом попаданий/промахов в статистике
+    def lookup(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    # Получение значения из кэша или через fetch(); одновременные промахи по ключу делят один запрос.
+    # Если fetch() падает (например, лимит запросов API), отдается устаревшее значение, если оно есть.
+    async def get_or_fetch(self, key, fetch):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        try:
+            value = await asyncio.shield(task)
+        except Exception:
+            stale = self.get(key, _MISSING, allow_stale=True)
+            if stale is _MISSING:
+                raise
+            self.stale_hits += 1
+            return stale
+        return value
+
+    async def _fetch_and_store(self, key, fetch):
+        value = await fetch()
+        self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+        }
+
+
+# Нормализация поискового запроса для ключа кэша
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+# Кэш результатов поиска FoodData Central: запрос -> (название, ккал на 100 г) или None
+food_cache = TTLCache(FOOD_CACHE_SIZE, FOOD_CACHE_TTL)
+
+
+# Поля, от которых зависит каждый тип графика
+CHART_FIELDS = {
+    "water": ("water_goal", "logged_water"),
+    "calories": ("calorie_goal", "logged_calories", "burned_calories"),
+}
+
+
+# Ключ графика: хэш типа графика и входных значений
+def chart_key(values, chart_type: str) -> str:
+    payload = chart_type + ":" + ":".join(repr(values[field]) for field in CHART_FIELDS[chart_type])
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+# Кэш отправленных графиков: ключ графика -> file_id фото в Telegram
+chart_cache = TTLCache(CHART_CACHE_SIZE, CHART_CACHE_TTL)
+
+
+# Кэш температуры по городам: устаревшее значение отдается сразу, а обновление идет в фоне
+class WeatherCache:
+    def __init__(self, ttl: float, concurrency: int, idle_ttl: float):
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.concurrency = concurrency
+        self._temps = {}  # city -> [fetched_at, last_used, temperature]
+        self._refreshing = {}
+        self._refresher = None
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self._temps)
+
+    # Температура из кэша без обращения к API (None, если город еще не известен)
+    def peek(self, city: str):
+        entry = self._temps.get(normalize_query(city))
+        return None if entry is None else entry[2]
+
+    # Подписка на изменение температуры: callback(city, old, new)
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    async def get_temperature(self, city: str, session):
+        key = normalize_query(city)
+        now = time.monotonic()
+        entry = self._temps.get(key)
+        if entry is None:
+            # Первый запрос по городу приходится ждать
+            self.misses += 1
+            return await self._refresh(key, city, session)
+
+        entry[1] = now
+        if now - entry[0] > self.ttl:
+            self.stale_hits += 1
+            if key not in self._refreshing:
+                asyncio.ensure_future(self._refresh(key, city, session))
+        else:
+            self.hits += 1
+        return entry[2]
+
+    async def _refresh(self, key: str, city: str, session):
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(key, city, session))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            return self.peek(key)
+
+    async def _fetch_and_store(self, key: str, city: str, session):
+        temperature = await get_temperature(city, session)
+        entry = self._temps.get(key)
+        if temperature is None:
+            return None if entry is None else entry[2]
+        now = time.monotonic()
+        if entry is None:
+            old = None
+            self._temps[key] = [now, now, temperature]
+        else:
+            old = entry[2]
+            entry[0], entry[2] = now, temperature
+        self.refreshes += 1
+        if old != temperature:
+            for callback in self._listeners:
+                callback(key, old, temperature)
+        return temperature
+
+    # Пакетное обновление всех активных городов с ограничением параллельности
+    async def refresh_all(self, session):
+        now = time.monotonic()
+        for key in [key for key, entry in self._temps.items() if now - entry[1] > self.idle_ttl]:
+            del self._temps[key]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_one(key):
+            async with semaphore:
+                await self._refresh(key, key, session)
+
+        await asyncio.gather(*(refresh_one(key) for key in list(self._temps)))
+
+    async def run_refresher(self, session, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh_all(session)
+
+    def start(self, session, interval: float = WEATHER_REFRESH_INTERVAL):
+        self._refresher = asyncio.ensure_future(self.run_refresher(session, interval))
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._temps),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+        }
+
+
+weather_cache = WeatherCache(WEATHER_CACHE_TTL, WEATHER_REFRESH_CONCURRENCY, WEATHER_CITY_IDLE_TTL)
+
+
+# Запуск фонового обновления погоды при старте диспетчера (после открытия HTTP-клиента)
+async def on_startup(dispatcher):
+    weather_cache.start(dispatcher["http_session"])
+
+
+async def on_shutdown(dispatcher):
+    await weather_cache.stop()
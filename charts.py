@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import CHART_EXECUTOR, CHART_WORKERS, CHART_MAX_QUEUE, CHART_WARMUP_DELAY
+from functions import generate_progress_chart, warm_up_charts
+from metrics import CHART_RENDER_LATENCY
+
+
+# Пул переполнен: запрос на график нужно отклонить
+class ChartQueueFull(Exception):
+    pass
+
+
+# Отрисовка графиков в ограниченном пуле процессов/потоков вне цикла событий
+class ChartRenderer:
+    def __init__(self, executor: str, workers: int, max_queue: int, warmup_delay: float):
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.warmup_delay = warmup_delay
+        self.pending = 0
+        self.rejected = 0
+        self.warmed_up = False
+        self._executor = None
+        self._warmup_task = None
+
+    def start(self):
+        if self._executor is None:
+            if self.executor_kind == "process":
+                # Не fork: в процессе уже работают потоки (запись в SQLite, резолвер aiohttp), и дочерний процесс,
+                # скопированный в момент, когда один из них держит блокировку, может зависнуть на ней навсегда
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(method))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    # matplotlib не загружается при запуске: воркеры пула прогреваются в фоне, когда бот уже отвечает
+    async def warm_up(self):
+        await asyncio.sleep(self.warmup_delay)
+        self.start()
+        loop = asyncio.get_running_loop()
+        # По заданию на воркера: пока один воркер занят прогревом, следующее задание достается другому
+        await asyncio.gather(*(loop.run_in_executor(self._executor, warm_up_charts) for _ in range(self.workers)))
+        self.warmed_up = True
+
+    def start_warm_up(self):
+        if self.warmup_delay >= 0 and self._warmup_task is None:
+            self._warmup_task = asyncio.ensure_future(self.warm_up())
+
+    # Ожидание незавершенных графиков идет в отдельном потоке, чтобы не блокировать цикл событий при остановке
+    async def stop(self):
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            self._warmup_task = None
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+    # Отрисовка одного графика в PNG; при переполнении очереди - ChartQueueFull
+    async def render(self, values, chart_type: str) -> bytes:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ChartQueueFull()
+
+        self.start()
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, generate_progress_chart, values, chart_type)
+        finally:
+            self.pending -= 1
+            CHART_RENDER_LATENCY.observe(time.perf_counter() - start, chart_type)
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "rejected": self.rejected, "warmed_up": int(self.warmed_up)}
+
+
+chart_renderer = ChartRenderer(CHART_EXECUTOR, CHART_WORKERS, CHART_MAX_QUEUE, CHART_WARMUP_DELAY)
+
+
+async def on_startup():
+    chart_renderer.start()
+    chart_renderer.start_warm_up()
+
+
+async def on_shutdown():
+    await chart_renderer.stop()
@@ -5,6 +5,9 @@ load_dotenv()
 
 TOKEN = os.getenv("BOT_TOKEN")
 
+# Адрес Bot API (можно указать локальный сервер Bot API)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
 # Получение API-ключа OpenWeatherMap
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
@@ -14,3 +17,131 @@ FOOD_DATA_CENTRAL_API_KEY = os.getenv("FOOD_DATA_CENTRAL_API_KEY")
 # Получение API-ключа и ID Nutritionix
 NUTRITIONIX_API_KEY = os.getenv("NUTRITIONIX_API_KEY")
 NUTRITIONIX_APP_ID = os.getenv("NUTRITIONIX_APP_ID")
+
+# Адреса внешних API (переопределяются для нагрузочных тестов с локальными заглушками)
+OPENWEATHER_API_URL = os.getenv("OPENWEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+FOOD_DATA_CENTRAL_API_URL = os.getenv("FOOD_DATA_CENTRAL_API_URL", "https://api.nal.usda.gov/fdc/v1/foods/search")
+NUTRITIONIX_API_URL = os.getenv("NUTRITIONIX_API_URL", "https://trackapi.nutritionix.com/v2/natural/exercise")
+
+# Настройки общего HTTP-клиента для внешних API
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+# Кэш поиска продуктов FoodData Central
+FOOD_CACHE_SIZE = int(os.getenv("FOOD_CACHE_SIZE", "5000"))
+FOOD_CACHE_TTL = float(os.getenv("FOOD_CACHE_TTL", "86400"))
+
+# Кэш температуры по городам и фоновое обновление
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "1800"))
+WEATHER_REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", "1200"))
+WEATHER_REFRESH_CONCURRENCY = int(os.getenv("WEATHER_REFRESH_CONCURRENCY", "10"))
+WEATHER_CITY_IDLE_TTL = float(os.getenv("WEATHER_CITY_IDLE_TTL", "604800"))
+
+# Пул отрисовки графиков: "process" или "thread", число воркеров и лимит очереди
+CHART_EXECUTOR = os.getenv("CHART_EXECUTOR", "process")
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_MAX_QUEUE = int(os.getenv("CHART_MAX_QUEUE", "16"))
+
+# Прогрев пула графиков (загрузка matplotlib и шрифтов) через столько секунд после запуска; отрицательное значение - без прогрева
+CHART_WARMUP_DELAY = float(os.getenv("CHART_WARMUP_DELAY", "5"))
+
+# Кэш отправленных графиков (file_id в Telegram)
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "10000"))
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL", "604800"))
+
+# Хранилище пользователей: "memory", "sqlite" или "columnar" (массивы NumPy в памяти для очень больших аудиторий)
+USER_STORE = os.getenv("USER_STORE", "memory")
+USER_DB_PATH = os.getenv("USER_DB_PATH", "users.db")
+USER_STORE_FLUSH_INTERVAL = float(os.getenv("USER_STORE_FLUSH_INTERVAL", "0.5"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+
+# Журнал событий (вода, еда, тренировки)
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "events")
+EVENT_SEGMENT_SIZE = int(os.getenv("EVENT_SEGMENT_SIZE", str(64 * 1024 * 1024)))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1"))
+
+# Режим работы: "polling" (по умолчанию) или "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+
+# Настройки вебхука
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENT = int(os.getenv("WEBHOOK_MAX_CONCURRENT", "100"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+# Ограничение частоты команд пользователя: "класс:запросов/секунд"
+THROTTLE_RATES = os.getenv("THROTTLE_RATES", "food:5/60,workout:5/60,chart:10/60,default:30/60")
+THROTTLE_SWEEP_INTERVAL = float(os.getenv("THROTTLE_SWEEP_INTERVAL", "300"))
+
+# Ограничение одновременных запросов к внешним API: лимит и длина очереди ожидания
+UPSTREAM_LIMITS = os.getenv("UPSTREAM_LIMITS", "openweathermap:10/50,fdc:10/50,nutritionix:10/50")
+
+# Предельное время вызова внешнего API в секундах (вместе с повторами): "сервис:секунды"
+UPSTREAM_DEADLINES = os.getenv("UPSTREAM_DEADLINES", "openweathermap:3,fdc:5,nutritionix:5")
+# Повторы идемпотентных GET-запросов при таймауте, ошибке соединения или 5xx; пауза - случайная в пределах
+# UPSTREAM_BACKOFF * 2^попытка секунд
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.1"))
+# Размыкатель цепи: после стольких неудачных вызовов подряд запросы к сервису сразу отклоняются на столько секунд
+UPSTREAM_BREAKER = os.getenv("UPSTREAM_BREAKER", "5/30")
+# Дублирующий GET-запрос, если первый идет дольше p95 последних ответов сервиса
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "0") == "1"
+
+# Метрики в формате Prometheus
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1"))
+
+# Кэш ставок расхода калорий для тренировок, неизвестных локальной таблице MET
+WORKOUT_RATE_CACHE_SIZE = int(os.getenv("WORKOUT_RATE_CACHE_SIZE", "2000"))
+
+# Офлайн-индекс продуктов FoodData Central (пусто - только API)
+FOOD_DB_PATH = os.getenv("FOOD_DB_PATH", "")
+
+# Многопроцессный режим (python supervisor.py): число воркеров, очереди и проверки здоровья
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "100"))
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "15"))
+SUPERVISOR_REPORT_INTERVAL = float(os.getenv("SUPERVISOR_REPORT_INTERVAL", "60"))
+SUPERVISOR_INTAKE = os.getenv("SUPERVISOR_INTAKE", "polling")
+# Номер воркера супервизора (задается supervisor.py); -1 - бот работает одним процессом
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "-1"))
+
+# Хранилище состояний FSM: "memory" или "sqlite"; незавершенные диалоги истекают через FSM_STATE_TTL секунд
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "fsm.db")
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "50000"))
+FSM_GC_INTERVAL = float(os.getenv("FSM_GC_INTERVAL", "600"))
+FSM_GC_BATCH = int(os.getenv("FSM_GC_BATCH", "1000"))
+
+# Пакетный пересчет норм воды и калорий: плановый интервал и пауза после изменения погоды
+GOALS_RECOMPUTE_INTERVAL = float(os.getenv("GOALS_RECOMPUTE_INTERVAL", "3600"))
+GOALS_WEATHER_DEBOUNCE = float(os.getenv("GOALS_WEATHER_DEBOUNCE", "5"))
+
+# Ежедневный сброс счетчиков в полночь по времени пользователя: шаг колеса таймеров, размер пачки,
+# часовой пояс для городов, которых нет в таблице, и файл архива дневных итогов
+ROLLOVER_TICK = float(os.getenv("ROLLOVER_TICK", "60"))
+ROLLOVER_BATCH = int(os.getenv("ROLLOVER_BATCH", "1000"))
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+DAY_ARCHIVE_PATH = os.getenv("DAY_ARCHIVE_PATH", os.path.join(EVENT_LOG_DIR, "days.log"))
+
+# Рассылки: лимиты Telegram (сообщений в секунду всего и в один чат), параллельность отправки
+# и каталог с заданиями и их прогрессом (незавершенные рассылки продолжаются после перезапуска)
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_DIR = os.getenv("BROADCAST_DIR", os.path.join(EVENT_LOG_DIR, "broadcasts"))
+
+# Напоминания о воде: локальный час рассылки и доля нормы, меньше которой пользователь считается отстающим
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "15"))
+REMINDER_THRESHOLD = float(os.getenv("REMINDER_THRESHOLD", "0.5"))
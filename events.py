@@ -0,0 +1,194 @@
+import asyncio
+import os
+import pickle
+import struct
+import time
+from datetime import date, timedelta
+
+from config import EVENT_LOG_DIR, EVENT_SEGMENT_SIZE, EVENT_FLUSH_INTERVAL
+
+# Типы событий и индексы в дневной сводке
+WATER = 0
+FOOD = 1
+WORKOUT = 2
+# Служебное событие: профиль сброшен, сводки пользователя очищаются (в том числе при повторном чтении журнала)
+RESET = 3
+
+# Самое длинное окно /history в днях: сводки старше него не хранятся
+HISTORY_DAYS = 30
+
+# Запись события: user_id, местное время пользователя (сек от эпохи со сдвигом его часового пояса), тип, количество.
+# День события - местный, тот же, что у ежедневного сброса счетчиков
+EVENT = struct.Struct("<qIBf")
+SECONDS_PER_DAY = 86400
+EPOCH = date(1970, 1, 1)
+
+
+# Номер дня (от начала эпохи, по местному времени) -> дата
+def day_to_date(day: int) -> date:
+    return EPOCH + timedelta(days=day)
+
+
+# Журнал событий только на дозапись, разбитый на сегменты, с инкрементальными дневными сводками
+class EventLog:
+    def __init__(self, directory: str, segment_size: int, flush_interval: float):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.rollups = {}  # user_id -> {день: [вода, калории, сожжено]}
+        self.events = 0
+        self._buffer = bytearray()
+        self._segment = 0
+        self._segment_bytes = 0
+        self._file = None
+        self._flusher = None
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"events-{number:06d}.log")
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith("events-") and name.endswith(".log"))
+
+    # Открытие журнала: загрузка снимка сводок и дочитывание событий, записанных после него
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_segment, snapshot_offset = self._load_snapshot()
+        segments = self._segments()
+        for name in segments:
+            number = int(name[7:13])
+            if number < snapshot_segment:
+                continue
+            with open(os.path.join(self.directory, name), "rb") as f:
+                if number == snapshot_segment:
+                    f.seek(snapshot_offset)
+                data = f.read()
+            usable = len(data) - len(data) % EVENT.size  # недописанный хвост после сбоя отбрасывается
+            for user_id, timestamp, kind, amount in EVENT.iter_unpack(memoryview(data)[:usable]):
+                self._apply(user_id, timestamp, kind, amount)
+        self._segment = int(segments[-1][7:13]) if segments else 1
+        self._open_segment()
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, "rollups.snapshot")
+
+    def _load_snapshot(self):
+        try:
+            with open(self._snapshot_path(), "rb") as f:
+                segment, offset, self.events, self.rollups = pickle.load(f)
+        except FileNotFoundError:
+            return 0, 0
+        return segment, offset
+
+    # Удаление сводок старше окна /history. Местный день пользователя отличается от дня по UTC не больше
+    # чем на сутки, поэтому хранится HISTORY_DAYS дней до сегодняшнего по UTC включительно
+    def prune(self, today: int = None):
+        if today is None:
+            today = int(time.time()) // SECONDS_PER_DAY
+        oldest = today - HISTORY_DAYS
+        for user_id in list(self.rollups):
+            days = self.rollups[user_id]
+            for day in [day for day in days if day < oldest]:
+                del days[day]
+            if not days:
+                del self.rollups[user_id]
+
+    # Снимок сводок вместе с позицией в журнале, до которой они посчитаны
+    def save_snapshot(self):
+        self.prune()
+        path = self._snapshot_path()
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump((self._segment, self._segment_bytes, self.events, self.rollups), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def _open_segment(self):
+        path = self._segment_path(self._segment)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._segment_bytes = size - size % EVENT.size
+        self._file = open(path, "ab")
+        self._file.truncate(self._segment_bytes)
+
+    def _apply(self, user_id, timestamp, kind, amount):
+        if kind == RESET:
+            self.rollups.pop(user_id, None)
+            self.events += 1
+            return
+        days = self.rollups.get(user_id)
+        if days is None:
+            days = self.rollups[user_id] = {}
+        totals = days.get(timestamp // SECONDS_PER_DAY)
+        if totals is None:
+            totals = days[timestamp // SECONDS_PER_DAY] = [0.0, 0.0, 0.0]
+        totals[kind] += amount
+        self.events += 1
+
+    # Добавление события: запись в буфер и обновление дневной сводки; utc_offset - сдвиг часового пояса пользователя
+    def append(self, user_id: int, kind: int, amount, timestamp: float = None, utc_offset: int = 0):
+        timestamp = int(time.time() if timestamp is None else timestamp) + utc_offset
+        self._buffer += EVENT.pack(user_id, timestamp, kind, amount)
+        self._apply(user_id, timestamp, kind, amount)
+
+    # Запись буфера в текущий сегмент (с переходом на новый сегмент при переполнении).
+    # Снимок после перехода сохраняется только когда буфер записан целиком: сводки уже включают все события
+    # буфера, поэтому позиция снимка должна указывать за последнее из них, иначе при запуске они учтутся дважды
+    def flush(self):
+        rotated = False
+        while self._buffer:
+            room = max(EVENT.size, self.segment_size - self._segment_bytes)
+            chunk = bytes(self._buffer[:room - room % EVENT.size])
+            del self._buffer[:len(chunk)]
+            self._file.write(chunk)
+            self._segment_bytes += len(chunk)
+            if self._segment_bytes >= self.segment_size:
+                self._file.close()
+                self._segment += 1
+                self._open_segment()
+                rotated = True
+        self._file.flush()
+        if rotated:
+            self.save_snapshot()
+
+    # Сводка пользователя за последние days дней по today (местный день пользователя): список (день, вода, калории, сожжено)
+    def history(self, user_id: int, days: int, today: int = None):
+        if today is None:
+            today = int(time.time()) // SECONDS_PER_DAY
+        user_days = self.rollups.get(user_id, {})
+        empty = (0.0, 0.0, 0.0)
+        return [(day, *user_days.get(day, empty)) for day in range(today - days + 1, today + 1)]
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def start(self):
+        if self._file is None:
+            self.open()
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self.save_snapshot()
+            self._file = None
+
+
+event_log = EventLog(EVENT_LOG_DIR, EVENT_SEGMENT_SIZE, EVENT_FLUSH_INTERVAL)
+
+
+async def on_startup():
+    event_log.start()
+
+
+async def on_shutdown():
+    await event_log.close()
@@ -0,0 +1,247 @@
+# Офлайн-база продуктов FoodData Central: компактный индекс на диске, отображаемый в память (mmap).
+#
+# Импорт выгрузки FDC (CSV-каталог с food.csv и food_nutrient.csv или JSON):
+#     python food_db.py import <путь к выгрузке> <файл индекса>
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from config import FOOD_DB_PATH
+
+MAGIC = b"FDB2"
+HEADER = struct.Struct("<4sII")  # сигнатура, число продуктов, число токенов
+ENERGY_NUTRIENT_IDS = {"1008", "2047", "2048"}  # Energy (kcal) и Energy (Atwater) в FDC
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+PREFIX_EXPANSION_LIMIT = 64  # сколько токенов максимум подставляется для префикса последнего слова
+
+
+# Слово в единственном числе (грубо, по окончанию): "Bananas, raw" находится по запросу "banana"
+def singular(token: str) -> str:
+    if len(token) <= 3 or not token.endswith("s") or token.endswith(("ss", "us", "is")):
+        return token
+    if token.endswith(("oes", "ches", "shes", "xes")):
+        return token[:-2]
+    return token[:-1]
+
+
+def tokenize(text: str):
+    return [singular(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+# Число букв в токенах описания: запрос покрывает наибольшую долю описания с наименьшим числом букв
+def letters(description: str) -> int:
+    return sum(len(token) for token in tokenize(description))
+
+
+# Чтение выгрузки FDC: (описание, ккал на 100 г)
+def read_fdc_export(path: str):
+    if os.path.isdir(path):
+        energy = {}
+        with open(os.path.join(path, "food_nutrient.csv"), newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                # Energy (kcal) важнее расчетных значений Atwater
+                if row["nutrient_id"] in ENERGY_NUTRIENT_IDS and (
+                        row["fdc_id"] not in energy or row["nutrient_id"] == "1008"):
+                    energy[row["fdc_id"]] = float(row["amount"] or 0)
+        with open(os.path.join(path, "food.csv"), newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row["fdc_id"] in energy:
+                    yield row["description"], energy[row["fdc_id"]]
+        return
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    foods = data if isinstance(data, list) else [food for value in data.values() for food in value]
+    for food in foods:
+        calories = next((nutrient.get("amount", 0) for nutrient in food.get("foodNutrients", [])
+                         if str(nutrient.get("nutrient", {}).get("number")) == "208"
+                         or str(nutrient.get("nutrient", {}).get("id")) in ENERGY_NUTRIENT_IDS), None)
+        if calories is not None:
+            yield food["description"], float(calories)
+
+
+# Построение индекса: продукты упорядочены по числу букв в описании, поэтому среди продуктов со всеми словами
+# запроса лучший (запрос покрывает большую часть описания) - с минимальным номером
+def build_index(foods, output: str):
+    foods = sorted(set(foods), key=lambda food: (letters(food[0]), len(food[0]), food[0]))
+    descriptions = array("I", [0])
+    description_blob = bytearray()
+    energies = array("f")
+    postings = {}
+    for food_id, (description, calories) in enumerate(foods):
+        description_blob += description.encode()
+        descriptions.append(len(description_blob))
+        energies.append(calories)
+        for token in set(tokenize(description)):
+            postings.setdefault(token, array("I")).append(food_id)
+
+    tokens = sorted(postings)
+    token_offsets = array("I", [0])
+    token_blob = bytearray()
+    posting_offsets = array("I", [0])
+    posting_ids = array("I")
+    for token in tokens:
+        token_blob += token.encode()
+        token_offsets.append(len(token_blob))
+        posting_ids.extend(postings[token])
+        posting_offsets.append(len(posting_ids))
+
+    with open(output + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(foods), len(tokens)))
+        # Длины блобов, затем сами массивы; каждая секция выровнена на 4 байта
+        sections = [energies.tobytes(), descriptions.tobytes(), token_offsets.tobytes(),
+                    posting_offsets.tobytes(), posting_ids.tobytes(), bytes(description_blob), bytes(token_blob)]
+        f.write(struct.pack("<7I", *(len(section) for section in sections)))
+        for section in sections:
+            f.write(section)
+            f.write(b"\0" * (-len(section) % 4))
+    os.replace(output + ".tmp", output)
+    return len(foods), len(tokens)
+
+
+# Поиск по индексу, отображенному в память: массивы читаются напрямую из mmap без копирования
+class FoodDatabase:
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.size, self.token_count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a food index")
+        lengths = struct.unpack_from("<7I", view, HEADER.size)
+        offset = HEADER.size + struct.calcsize("<7I")
+        sections = []
+        for length in lengths:
+            sections.append(view[offset:offset + length])
+            offset += length + (-length % 4)
+        self._energies = sections[0].cast("f")
+        self._descriptions = sections[1].cast("I")
+        self._token_offsets = sections[2].cast("I")
+        self._posting_offsets = sections[3].cast("I")
+        self._posting_ids = sections[4].cast("I")
+        self._description_blob = sections[5]
+        self._token_blob = sections[6]
+
+    def _token(self, index: int) -> bytes:
+        return bytes(self._token_blob[self._token_offsets[index]:self._token_offsets[index + 1]])
+
+    # Первый токен, не меньший key (бинарный поиск по отсортированному списку токенов)
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.token_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._token(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Диапазоны списков продуктов для токена (prefix=True - все токены с таким началом)
+    def _ranges(self, token: str, prefix: bool):
+        key = token.encode()
+        index = self._lower_bound(key)
+        ranges = []
+        while index < self.token_count:
+            current = self._token(index)
+            if current != key and not (prefix and current.startswith(key)):
+                break
+            ranges.append((self._posting_offsets[index], self._posting_offsets[index + 1]))
+            if len(ranges) >= PREFIX_EXPANSION_LIMIT:
+                break
+            index += 1
+        return ranges
+
+    # Наименьший номер продукта >= food_id среди диапазонов (None, если такого нет)
+    def _next_at_least(self, ranges, food_id: int):
+        ids = self._posting_ids
+        best = None
+        for start, end in ranges:
+            position = bisect_left(ids, food_id, start, end)
+            if position < end and (best is None or ids[position] < best):
+                best = ids[position]
+        return best
+
+    def description(self, food_id: int) -> str:
+        return bytes(self._description_blob[self._descriptions[food_id]:self._descriptions[food_id + 1]]).decode()
+
+    # Поиск продукта: (название, ккал на 100 г) или None. Сначала ищутся точные совпадения всех слов запроса,
+    # и только если их нет - последнее слово ищется по префиксу (запрос набран не до конца)
+    def lookup(self, query: str):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        food_id = self._intersect([self._ranges(token, prefix=False) for token in tokens])
+        if food_id is None:
+            food_id = self._intersect([self._ranges(token, prefix=position == len(tokens) - 1)
+                                       for position, token in enumerate(tokens)])
+        if food_id is None:
+            return None
+        return self.description(food_id).capitalize(), round(self._energies[food_id], 1)
+
+    # Пересечение "чехардой": кандидат сдвигается бинарным поиском до следующего номера в каждом списке,
+    # пока все списки не сойдутся; первый общий продукт и есть лучший (продукты упорядочены по числу букв)
+    def _intersect(self, groups):
+        if not all(groups):
+            return None
+        groups.sort(key=lambda ranges: sum(end - start for start, end in ranges))
+        candidate = 0
+        while True:
+            agreed = True
+            for ranges in groups:
+                food_id = self._next_at_least(ranges, candidate)
+                if food_id is None:
+                    return None
+                if food_id != candidate:
+                    candidate = food_id
+                    agreed = False
+            if agreed:
+                return candidate
+
+    def close(self):
+        self._energies.release()
+        self._descriptions.release()
+        self._token_offsets.release()
+        self._posting_offsets.release()
+        self._posting_ids.release()
+        self._description_blob.release()
+        self._token_blob.release()
+        self._mmap.close()
+        self._file.close()
+
+
+# Локальная база загружается при старте, если задан FOOD_DB_PATH
+_database = None
+
+
+# Поиск в локальной базе (None, если база не загружена или продукт не найден)
+def local_lookup(query: str):
+    if _database is None:
+        return None
+    return _database.lookup(query)
+
+
+async def on_startup():
+    global _database
+    if FOOD_DB_PATH and _database is None:
+        _database = FoodDatabase(FOOD_DB_PATH)
+
+
+async def on_shutdown():
+    global _database
+    if _database is not None:
+        _database.close()
+        _database = None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "import":
+        print("Использование: python food_db.py import <выгрузка FDC> <файл индекса>")
+        sys.exit(1)
+    foods, tokens = build_index(read_fdc_export(sys.argv[2]), sys.argv[3])
+    print(f"Индекс построен: {foods} продуктов, {tokens} токенов")
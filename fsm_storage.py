@@ -0,0 +1,134 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_DB_PATH, FSM_STATE_TTL, FSM_CACHE_SIZE, FSM_GC_INTERVAL, FSM_GC_BATCH
+
+
+# Хранилище FSM в SQLite (WAL) с кэшем в памяти: записи сразу идут в базу, чтения - из кэша.
+# Незавершенные диалоги старше FSM_STATE_TTL считаются устаревшими и удаляются пачками.
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str, ttl: float, cache_size: int, gc_interval: float, gc_batch: int):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.gc_interval = gc_interval
+        self.gc_batch = gc_batch
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS fsm "
+                           "(key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_updated ON fsm (updated)")
+        self._conn.commit()
+        self._cache = OrderedDict()  # key -> [state, data, updated]
+        self._gc_task = None
+        self.collected = 0
+
+    def _load(self, key: str):
+        record = self._cache.get(key)
+        if record is None:
+            row = self._conn.execute("SELECT state, data, updated FROM fsm WHERE key = ?", (key,)).fetchone()
+            record = [None, {}, 0.0] if row is None else [row[0], json.loads(row[1]), row[2]]
+            self._cache[key] = record
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        # Устаревший диалог считается пустым
+        if record[0] is not None or record[1]:
+            if time.time() - record[2] > self.ttl:
+                record[0], record[1] = None, {}
+        return record
+
+    def _store(self, key: str, record):
+        record[2] = time.time()
+        with self._conn:
+            if record[0] is None and not record[1]:
+                self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            else:
+                self._conn.execute("INSERT OR REPLACE INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?)",
+                                   (key, record[0], json.dumps(record[1]), record[2]))
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        string_key = self.key_builder.build(key)
+        record = self._load(string_key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._store(string_key, record)
+
+    async def get_state(self, key: StorageKey):
+        return self._load(self.key_builder.build(key))[0]
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        string_key = self.key_builder.build(key)
+        record = self._load(string_key)
+        record[1] = data.copy()
+        self._store(string_key, record)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        return self._load(self.key_builder.build(key))[1].copy()
+
+    # Удаление устаревших диалогов пачками, чтобы не держать блокировку базы надолго
+    def collect_garbage(self) -> int:
+        deadline = time.time() - self.ttl
+        removed = 0
+        while True:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM fsm WHERE rowid IN (SELECT rowid FROM fsm WHERE updated < ? LIMIT ?)",
+                    (deadline, self.gc_batch))
+            removed += cursor.rowcount
+            if cursor.rowcount < self.gc_batch:
+                break
+        for key in [key for key, record in self._cache.items() if record[2] < deadline]:
+            del self._cache[key]
+        self.collected += removed
+        return removed
+
+    async def _run_gc(self):
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            self.collect_garbage()
+
+    def start(self):
+        if self._gc_task is None:
+            self._gc_task = asyncio.ensure_future(self._run_gc())
+
+    async def close(self) -> None:
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except asyncio.CancelledError:
+                pass
+            self._gc_task = None
+        self._conn.close()
+
+    def stats(self) -> dict:
+        return {"cached": len(self._cache), "collected": self.collected}
+
+
+# Создание хранилища FSM по настройке FSM_STORAGE ("memory" или "sqlite")
+def create_fsm_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    if kind == "sqlite":
+        return SQLiteStorage(FSM_DB_PATH, FSM_STATE_TTL, FSM_CACHE_SIZE, FSM_GC_INTERVAL, FSM_GC_BATCH)
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown FSM storage: {kind}")
+
+
+# Запуск сборки мусора при старте диспетчера. Закрывает хранилище (и останавливает сборку мусора) сам Dispatcher:
+# он регистрирует fsm.close при остановке
+async def on_startup(dispatcher):
+    if isinstance(dispatcher.storage, SQLiteStorage):
+        dispatcher.storage.start()
@@ -1,35 +1,68 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import aiohttp
-import matplotlib.pyplot as plt
-from config import OPENWEATHER_API_KEY
+import io
+from config import OPENWEATHER_API_KEY, FOOD_DATA_CENTRAL_API_KEY, OPENWEATHER_API_URL, FOOD_DATA_CENTRAL_API_URL
+from http_client import UpstreamError, upstreams
 
 
 # Получение API-ключей
 open_weather_api = OPENWEATHER_API_KEY
 
 
-# Получение температуры в городе через OpenWeatherMap
-async def get_temperature(city: str) -> float:
-    url = f"http://api.openweathermap.org/data/2.5/weather"
+# Получение температуры в городе через OpenWeatherMap (None, если город не найден).
+# При 5xx, таймауте или разомкнутой цепи - UpstreamError; последнее известное значение отдает кэш погоды
+async def get_temperature(city: str, session: aiohttp.ClientSession) -> float:
+    url = OPENWEATHER_API_URL
     params = {
         "q": city,
         "appid": open_weather_api,
         "units": "metric"
     }
-    async with aiohttp.ClientSession() as session:
+
+    async def request():
         async with session.get(url, params=params) as response:
+            if response.status >= 500:
+                raise UpstreamError("openweathermap", response.status)
             if response.status == 200:
                 data = await response.json()
                 return data["main"]["temp"]
             else:
                 return None
 
+    return await upstreams["openweathermap"].call(request)
+
+
+# Поиск продукта через FoodData Central API: (название, ккал на 100 г) или None, если не найден
+async def search_food(query: str, session: aiohttp.ClientSession):
+    url = FOOD_DATA_CENTRAL_API_URL
+    params = {"query": query, "api_key": FOOD_DATA_CENTRAL_API_KEY}
+
+    async def request():
+        async with session.get(url, params=params) as response:
+            if response.status != 200:
+                raise UpstreamError("fdc", response.status)
+            return await response.json()
+
+    data = await upstreams["fdc"].call(request)
+
+    if not data.get("foods"):
+        return None
+
+    # Храним только нужные поля, а не весь ответ API
+    food_item = data["foods"][0]
+    food_name = food_item.get("description", query).capitalize()
+    calories_per_100g = next(
+        (nutrient["value"] for nutrient in food_item.get("foodNutrients", []) if
+         nutrient.get("nutrientName") == "Energy"), 0
+    )
+    return food_name, calories_per_100g
+
 
 # Расчет нормы воды
 def calculate_water_goal(weight, activity_minutes, temperature):
     base_water = weight * 30
     activity_bonus = (activity_minutes // 30) * 500
-    weather_bonus = 500 if temperature > 25 else 0
+    weather_bonus = 500 if temperature is not None and temperature > 25 else 0
     return base_water + activity_bonus + weather_bonus
 
 
@@ -40,6 +73,26 @@ def calculate_calorie_goal(weight, height, age, activity_minutes):
     return base_calories + activity_bonus
 
 
+# Векторные версии расчета норм для массивов профилей (те же формулы, что и выше, поэлементно).
+# NumPy импортируется при первом пересчете, а не при запуске бота
+def calculate_water_goals(weight, activity_minutes, temperature):
+    import numpy as np
+
+    base_water = weight * 30
+    activity_bonus = (activity_minutes // 30) * 500
+    # NaN (температура неизвестна) не больше 25, как и None в скалярной версии
+    weather_bonus = np.where(temperature > 25, 500, 0)
+    return base_water + activity_bonus + weather_bonus
+
+
+def calculate_calorie_goals(weight, height, age, activity_minutes):
+    import numpy as np
+
+    base_calories = 10 * weight + 6.25 * height - 5 * age
+    activity_bonus = np.minimum(400, np.maximum(200, activity_minutes * 5))
+    return base_calories + activity_bonus
+
+
 # Создание кнопок для выбора графиков
 def create_chart_selection_keyboard():
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -49,35 +102,51 @@ def create_chart_selection_keyboard():
     return keyboard
 
 
-# Построение графиков прогресса
-def generate_progress_charts(user_data, user_id):
-    # Получаем данные
-    water_goal = user_data.get("water_goal", 0)
-    logged_water = user_data.get("logged_water", 0)
-
-    calorie_goal = user_data.get("calorie_goal", 0)
-    logged_calories = user_data.get("logged_calories", 0)
-    burned_calories = user_data.get("burned_calories", 0)
-
-    # Считаем остаток
-    remaining_water = max(0, water_goal - logged_water)
-    remaining_calories = max(0, calorie_goal - (logged_calories - burned_calories))
-
-    # Построение графика воды
-    plt.figure(figsize=(8, 4))
-    plt.bar(["Выпито", "Осталось"], [logged_water, remaining_water], color=["#1f77b4", "#ff7f0e"])
-    plt.title("Прогресс по воде (мл)")
-    plt.ylabel("Миллитры")
-    plt.savefig(f"water_progress_{user_id}.png")
-    plt.close()
-
-    # Построение графика калорий
-    plt.figure(figsize=(8, 4))
-    plt.bar(["Потреблено", "Сожжено", "Осталось"], [logged_calories, burned_calories, remaining_calories],
-            color=["#2ca02c", "#d62728", "#9467bd"])
-    plt.title("Прогресс по калориям (ккал)")
-    plt.ylabel("Калории")
-    plt.savefig(f"calorie_progress_{user_id}.png")
-    plt.close()
-
-    return f"water_progress_{user_id}.png", f"calorie_progress_{user_id}.png"
+# Значения для графиков прогресса (простые числа, чтобы их можно было передать в пул процессов)
+def chart_values(user):
+    return {
+        "water_goal": user.water_goal,
+        "logged_water": user.logged_water,
+        "calorie_goal": user.calorie_goal,
+        "logged_calories": user.logged_calories,
+        "burned_calories": user.burned_calories,
+    }
+
+
+# Построение графика прогресса в PNG (объектный API Agg, без глобального состояния pyplot).
+# matplotlib загружается при первом графике в процессе отрисовки или при прогреве, а не при импорте модуля
+def generate_progress_chart(values, chart_type):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(8, 4))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+
+    if chart_type == "water":
+        # Считаем остаток воды
+        remaining_water = max(0, values["water_goal"] - values["logged_water"])
+        ax.bar(["Выпито", "Осталось"], [values["logged_water"], remaining_water], color=["#1f77b4", "#ff7f0e"])
+        ax.set_title("Прогресс по воде (мл)")
+        ax.set_ylabel("Миллитры")
+    elif chart_type == "calories":
+        # Считаем остаток калорий
+        logged_calories = values["logged_calories"]
+        burned_calories = values["burned_calories"]
+        remaining_calories = max(0, values["calorie_goal"] - (logged_calories - burned_calories))
+        ax.bar(["Потреблено", "Сожжено", "Осталось"], [logged_calories, burned_calories, remaining_calories],
+               color=["#2ca02c", "#d62728", "#9467bd"])
+        ax.set_title("Прогресс по калориям (ккал)")
+        ax.set_ylabel("Калории")
+    else:
+        raise ValueError(f"Unknown chart type: {chart_type}")
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+# Прогрев отрисовки: загрузка matplotlib и шрифтов пустым графиком, чтобы первый пользовательский график был быстрым
+def warm_up_charts():
+    values = {"water_goal": 0, "logged_water": 0, "calorie_goal": 0.0, "logged_calories": 0.0, "burned_calories": 0.0}
+    generate_progress_chart(values, "water")
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from cache import normalize_query, weather_cache
+from config import GOALS_RECOMPUTE_INTERVAL, GOALS_WEATHER_DEBOUNCE
+from functions import calculate_water_goals, calculate_calorie_goals
+from storage import users
+
+
+# Профили всех пользователей в столбцах NumPy; температура берется по индексу города.
+# NumPy импортируется при первом пересчете, чтобы не замедлять запуск бота
+class ProfileColumns:
+    def __init__(self, user_ids, records, temperature_of):
+        import numpy as np
+
+        self.user_ids = user_ids
+        self.weight = np.array([record.weight for record in records], dtype=float)
+        self.height = np.array([record.height for record in records], dtype=float)
+        self.age = np.array([record.age for record in records], dtype=float)
+        self.activity = np.array([record.activity for record in records], dtype=float)
+        self.water_goal = np.array([record.water_goal for record in records], dtype=float)
+        self.calorie_goal = np.array([record.calorie_goal for record in records], dtype=float)
+
+        # Названия нормализуются один раз на каждое уникальное написание города
+        cities = {}
+        spellings = {}
+        for spelling in {record.city for record in records}:
+            spellings[spelling] = cities.setdefault(normalize_query(spelling), len(cities))
+        city_index = np.array([spellings[record.city] for record in records], dtype=np.intp)
+        city_temperature = np.full(len(cities), np.nan)
+        known_city = np.zeros(len(cities), dtype=bool)
+        for city, index in cities.items():
+            temperature = temperature_of(city)
+            if temperature is not None:
+                city_temperature[index] = temperature
+                known_city[index] = True
+        self.temperature = city_temperature[city_index]
+        self.known_temperature = known_city[city_index]
+
+
+# Пересчет норм всех пользователей одним векторным проходом по расписанию и при смене погоды
+class GoalRecalculator:
+    def __init__(self, store, weather, interval: float, debounce: float):
+        self.store = store
+        self.weather = weather
+        self.interval = interval
+        self.debounce = debounce
+        self._weather_changed = asyncio.Event()
+        self._task = None
+        self.runs = 0
+        self.updated = 0
+        self.last_duration = 0.0
+        self.errors = 0
+        weather.subscribe(self._on_weather_change)
+
+    # Пересчет нужен, только если город пересек порог жары из calculate_water_goal
+    def _on_weather_change(self, city, old, new):
+        if (old is not None and old > 25) != (new > 25):
+            self._weather_changed.set()
+
+    # Записывает только изменившиеся нормы; возвращает число обновленных пользователей
+    def recompute(self) -> int:
+        import numpy as np
+
+        begin = time.perf_counter()
+        user_ids, records = self.store.snapshot()
+        columns = ProfileColumns(user_ids, records, self.weather.peek)
+        water = calculate_water_goals(columns.weight, columns.activity, columns.temperature)
+        calories = calculate_calorie_goals(columns.weight, columns.height, columns.age, columns.activity)
+        # Без температуры норму воды не трогаем: бонус за жару нельзя ни подтвердить, ни снять
+        water = np.where(columns.known_temperature, water, columns.water_goal)
+        # Норма воды хранится в целых миллилитрах
+        water = np.round(water)
+        changed = np.flatnonzero((water != columns.water_goal) | (calories != columns.calorie_goal))
+
+        water_goals = water[changed].tolist()
+        calorie_goals = calories[changed].tolist()
+        for i, row in enumerate(changed.tolist()):
+            self.store.update(columns.user_ids[row], water_goal=water_goals[i], calorie_goal=calorie_goals[i])
+
+        self.runs += 1
+        self.updated += len(changed)
+        self.last_duration = time.perf_counter() - begin
+        return len(changed)
+
+    # Запрос температуры для городов из профилей, которых еще нет в кэше погоды
+    async def prefetch_weather(self, session):
+        _, records = self.store.snapshot()
+        cities = {normalize_query(city) for city in {record.city for record in records}}
+        missing = [city for city in cities if self.weather.peek(city) is None]
+        semaphore = asyncio.Semaphore(self.weather.concurrency)
+
+        async def fetch_one(city):
+            async with semaphore:
+                await self.weather.get_temperature(city, session)
+
+        await asyncio.gather(*(fetch_one(city) for city in missing))
+
+    async def run(self, session):
+        while True:
+            try:
+                await asyncio.wait_for(self._weather_changed.wait(), self.interval)
+                # Ждем, пока пакетное обновление погоды затронет остальные города
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._weather_changed.clear()
+            try:
+                await self.prefetch_weather(session)
+                self.recompute()
+            except Exception as e:
+                # Ошибка одного прохода (база, сеть) не останавливает пересчет: следующий пройдет по расписанию
+                self.errors += 1
+                print(f"Ошибка пересчета норм: {e!r}")
+
+    def start(self, session):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run(session))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "updated": self.updated, "last_duration": self.last_duration, "errors": self.errors}
+
+
+goal_recalculator = GoalRecalculator(users, weather_cache, GOALS_RECOMPUTE_INTERVAL, GOALS_WEATHER_DEBOUNCE)
+
+
+# Запуск пересчета при старте диспетчера (после открытия HTTP-клиента)
+async def on_startup(dispatcher):
+    goal_recalculator.start(dispatcher["http_session"])
+
+
+async def on_shutdown(dispatcher):
+    await goal_recalculator.stop()
@@ -1,25 +1,29 @@
 from aiogram import Router
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 import aiohttp
 from aiogram.filters.state import StateFilter
-import os
+from aiogram.exceptions import TelegramBadRequest
 from states import Form
-from config import OPENWEATHER_API_KEY, FOOD_DATA_CENTRAL_API_KEY, NUTRITIONIX_API_KEY, NUTRITIONIX_APP_ID
-from functions import get_temperature, calculate_water_goal, calculate_calorie_goal, create_chart_selection_keyboard
-from functions import generate_progress_charts
+from config import OPENWEATHER_API_KEY, FOOD_DATA_CENTRAL_API_KEY
+from functions import calculate_water_goal, calculate_calorie_goal, create_chart_selection_keyboard
+from functions import search_food, chart_values
+from charts import chart_renderer, ChartQueueFull
+from cache import food_cache, weather_cache, chart_cache, normalize_query, chart_key
+from http_client import UpstreamError, UpstreamBusy
+from workouts import workout_calories
+from food_db import local_lookup
+from storage import users
+from records import UserRecord
+from rollover import rollover_scheduler, city_timezone, utc_offset
+from events import event_log, day_to_date, WATER, FOOD, WORKOUT, RESET
 
 router = Router()
 
-# Временное хранилище данных
-users = {}
-
 # Получение API-ключей
 open_weather_api = OPENWEATHER_API_KEY
 food_data_api = FOOD_DATA_CENTRAL_API_KEY
-nutritionix_api = NUTRITIONIX_API_KEY
-nutritionix_id = NUTRITIONIX_APP_ID
 
 
 # ХЭНДЛЕР /start (Запуск бота)
@@ -41,6 +45,7 @@ async def cmd_help(message: Message):
         "/log_food - Трекинг калорий\n"
         "/log_workout - Трекинг физической активности\n"
         "/check_progress - Проверка текущего прогресса\n"
+        "/history - История за 7 или 30 дней\n"
         "/progress_charts - Графики прогресса по воде и калориям\n"
         "/update_weight - Обновление данных по весу\n"
         "/reset - Удаление профиля (сброс настроек)\n"
@@ -92,12 +97,11 @@ async def process_activity(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(Form.city))
-async def process_city(message: Message, state: FSMContext):
+async def process_city(message: Message, state: FSMContext, http_session: aiohttp.ClientSession):
     # Обработка города и завершение настройки профиля
     city = message.text
-    temperature = await get_temperature(city)
+    temperature = await weather_cache.get_temperature(city, http_session)
     user_data = await state.get_data()
-    user_data["city"] = city
 
     weight = user_data["weight"]
     height = user_data["height"]
@@ -105,19 +109,17 @@ async def process_city(message: Message, state: FSMContext):
     activity = user_data["activity"]
 
     # Подсчет норм воды и калорий
-    water_goal = calculate_water_goal(weight, activity, temperature)
-    calorie_goal = calculate_calorie_goal(weight, height, age, activity)
+    record = UserRecord(weight, height, age, activity, city, timezone=city_timezone(city),
+                        water_goal=calculate_water_goal(weight, activity, temperature),
+                        calorie_goal=calculate_calorie_goal(weight, height, age, activity))
+    water_goal = record.water_goal
+    calorie_goal = record.calorie_goal
 
-    # Сохранение данных
+    # Сохранение данных и планирование сброса счетчиков в полночь по часовому поясу города
     user_id = message.from_user.id
-    users[user_id] = {
-        **user_data,
-        "water_goal": water_goal,
-        "calorie_goal": calorie_goal,
-        "logged_water": 0,
-        "logged_calories": 0,
-        "burned_calories": 0,
-    }
+    record.day = rollover_scheduler.local_day(record)
+    users.set(user_id, record)
+    rollover_scheduler.schedule(user_id, record)
 
     await message.answer(
         f"Профиль настроен! Вот ваши данные:\n"
@@ -126,7 +128,7 @@ async def process_city(message: Message, state: FSMContext):
         f"Возраст: {age} лет\n"
         f"Активность: {activity} минут в день\n"
         f"Город: {city}\n"
-        f"Температура: {temperature}°C\n"
+        f"Температура: {'нет данных' if temperature is None else f'{temperature}°C'}\n"
         f"Цель по воде: {water_goal} мл\n"
         f"Цель по калориям: {calorie_goal} ккал"
     )
@@ -148,9 +150,11 @@ async def cmd_log_water(message: Message):
         return
 
     water_amount = int(parts[1])
-    users[user_id]["logged_water"] += water_amount
+    rollover_scheduler.ensure_current(user_id)
+    user = users.increment(user_id, "logged_water", water_amount)
+    event_log.append(user_id, WATER, water_amount, utc_offset=utc_offset(user))
 
-    remaining_water = max(0, users[user_id]["water_goal"] - users[user_id]["logged_water"])
+    remaining_water = max(0, user.water_goal - user.logged_water)
 
     await message.answer(
         f"Записано: {water_amount} мл воды. "
@@ -160,7 +164,7 @@ async def cmd_log_water(message: Message):
 
 # ХЭНДЛЕР /log_food (Логирование еды)
 @router.message(Command("log_food"))
-async def cmd_log_food(message: Message, state: FSMContext):
+async def cmd_log_food(message: Message, state: FSMContext, http_session: aiohttp.ClientSession):
     user_id = message.from_user.id
     if user_id not in users:
         await message.answer("Сначала настройте профиль с помощью команды /set_profile.")
@@ -172,30 +176,25 @@ async def cmd_log_food(message: Message, state: FSMContext):
         await message.answer("Введите название продукта на английском языке. Пример: /log_food banana")
         return
 
-    # Поиск продукта через FoodData Central API
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-                f"https://api.nal.usda.gov/fdc/v1/foods/search",
-                params={"query": user_input, "api_key": FOOD_DATA_CENTRAL_API_KEY}
-        ) as food_data_response:
-            if food_data_response.status != 200:
-                await message.answer("Ошибка при поиске данных о продукте. Попробуйте позже.")
-                return
-
-            food_data = await food_data_response.json()
-
-    # Проверяем, есть ли продукты в ответе
-    if not food_data.get("foods"):
+    # Поиск продукта в локальной базе, затем через FoodData Central API (с кэшем по нормализованному запросу)
+    query = normalize_query(user_input)
+    food = local_lookup(query)
+    if food is None:
+        try:
+            food = await food_cache.get_or_fetch(query, lambda: search_food(query, http_session))
+        except UpstreamBusy:
+            await message.answer("Сервис поиска продуктов сейчас перегружен. Попробуйте позже.")
+            return
+        except (UpstreamError, aiohttp.ClientError):
+            await message.answer("Ошибка при поиске данных о продукте. Попробуйте позже.")
+            return
+
+    # Проверяем, найден ли продукт
+    if food is None:
         await message.answer(f"Продукт '{user_input}' не найден. Убедитесь, что вы ввели название на английском языке.")
         return
 
-    # Получаем данные о калориях
-    food_item = food_data["foods"][0]
-    food_name = food_item.get("description", user_input).capitalize()
-    calories_per_100g = next(
-        (nutrient["value"] for nutrient in food_item.get("foodNutrients", []) if
-         nutrient.get("nutrientName") == "Energy"), 0
-    )
+    food_name, calories_per_100g = food
 
     await state.update_data(calories_per_100g=calories_per_100g, food_name=food_name)
 
@@ -222,83 +221,78 @@ async def process_food_weight(message: Message, state: FSMContext):
         calories_per_100g = user_data.get("calories_per_100g", 0)
 
         total_calories = (calories_per_100g * food_weight) / 100
-        users[user_id]["logged_calories"] += total_calories
+        rollover_scheduler.ensure_current(user_id)
+        user = users.increment(user_id, "logged_calories", total_calories)
+        event_log.append(user_id, FOOD, total_calories, utc_offset=utc_offset(user))
 
         await message.answer(
             f"Записано: {food_name} — {total_calories:.1f} ккал.\n"
-            f"Общее потребление калорий: {users[user_id]['logged_calories']:.1f} ккал."
+            f"Общее потребление калорий: {user.logged_calories:.1f} ккал."
         )
         await state.clear()
     except ValueError:
         await message.answer("Введите корректное число грамм.")
 
 
-# Отслеживание сожженых калорий на тренировке
-NUTRITIONIX_API_URL = "https://trackapi.nutritionix.com/v2/natural/exercise"
-NUTRITIONIX_HEADERS = {
-    "x-app-id": nutritionix_id,
-    "x-app-key": nutritionix_api,
-    "Content-Type": "application/json"
-}
-
 # ХЭНДЛЕР /log_workout (Логирование тренировок)
 @router.message(Command("log_workout"))
-async def cmd_log_workout(message: Message):
+async def cmd_log_workout(message: Message, http_session: aiohttp.ClientSession):
     user_id = message.from_user.id
     if user_id not in users:
         await message.answer("Сначала настройте профиль с помощью команды /set_profile.")
         return
 
-    # Извлечение типа тренировки и времени из команды
-    parts = message.text.split(maxsplit=2)
-    if len(parts) != 3:
+    # Извлечение типа тренировки (может состоять из нескольких слов) и времени из команды
+    parts = message.text.split(maxsplit=1)
+    parts = parts[1].rsplit(maxsplit=1) if len(parts) == 2 else []
+    if len(parts) != 2:
         await message.answer("Введите тип тренировки и время в минутах. Пример: /log_workout бег 30")
         return
 
-    workout_type = parts[1].lower()
+    workout_type = parts[0].lower()
     try:
-        duration = int(parts[2])
+        duration = int(parts[1])
     except ValueError:
         await message.answer("Введите время тренировки в минутах числом. Пример: /log_workout бег 30")
         return
+    if duration <= 0:
+        await message.answer("Время тренировки должно быть больше нуля. Пример: /log_workout бег 30")
+        return
+
+    # Расчет по локальной таблице MET, для неизвестных тренировок - через Nutritionix API
+    user = users.get(user_id)
+    try:
+        calories_burned = await workout_calories(workout_type, duration, user, http_session)
+    except UpstreamBusy:
+        await message.answer("Сервис расчета тренировок сейчас перегружен. Попробуйте позже.")
+        return
+    except (UpstreamError, aiohttp.ClientError):
+        await message.answer("Ошибка при запросе данных о тренировке.")
+        return
+
+    if calories_burned is None:
+        await message.answer(f"Не удалось найти информацию о тренировке: {workout_type}.")
+        return
 
-    # Формирование запроса к API Nutritionix
-    request_data = {
-        "query": f"{duration} minutes of {workout_type}",
-        "gender": "male",  # По умолчанию, можно добавить в профиль
-        "weight_kg": users[user_id]["weight"],
-        "height_cm": users[user_id]["height"],
-        "age": users[user_id]["age"]
-    }
-
-    # Запрос к Nutritionix API
-    async with aiohttp.ClientSession() as session:
-        async with session.post(NUTRITIONIX_API_URL, headers=NUTRITIONIX_HEADERS, json=request_data) as response:
-            if response.status == 200:
-                data = await response.json()
-                if "exercises" in data and len(data["exercises"]) > 0:
-                    exercise = data["exercises"][0]
-                    calories_burned = exercise["nf_calories"]
-
-                    # Дополнительный расчет воды
-                    extra_water = (duration // 30) * 200  # 200 мл за каждые 30 минут
-
-                    # Обновление данных пользователя
-                    users[user_id]["burned_calories"] += calories_burned
-                    users[user_id]["logged_water"] += extra_water
-
-                    remaining_water = max(0, users[user_id]["water_goal"] - users[user_id]["logged_water"])
-
-                    # Ответ пользователю
-                    await message.answer(
-                        f"{workout_type.capitalize()} {duration} минут — {calories_burned:.1f} ккал.\n"
-                        f"Дополнительно: выпейте {extra_water} мл воды.\n"
-                        f"Осталось до нормы воды: {remaining_water} мл."
-                    )
-                else:
-                    await message.answer(f"Не удалось найти информацию о тренировке: {workout_type}.")
-            else:
-                await message.answer("Ошибка при запросе данных о тренировке.")
+    # Дополнительный расчет воды
+    extra_water = (duration // 30) * 200  # 200 мл за каждые 30 минут
+
+    # Обновление данных пользователя (счетчики прошлого дня сначала уходят в архив)
+    rollover_scheduler.ensure_current(user_id)
+    users.increment(user_id, "burned_calories", calories_burned)
+    user = users.increment(user_id, "logged_water", extra_water)
+    offset = utc_offset(user)
+    event_log.append(user_id, WORKOUT, calories_burned, utc_offset=offset)
+    event_log.append(user_id, WATER, extra_water, utc_offset=offset)
+
+    remaining_water = max(0, user.water_goal - user.logged_water)
+
+    # Ответ пользователю
+    await message.answer(
+        f"{workout_type.capitalize()} {duration} минут — {calories_burned:.1f} ккал.\n"
+        f"Дополнительно: выпейте {extra_water} мл воды.\n"
+        f"Осталось до нормы воды: {remaining_water} мл."
+    )
 
 
 # ХЭНДЛЕР /check_progress (Прогресс по воде и калориям)
@@ -309,15 +303,16 @@ async def cmd_check_progress(message: Message):
         await message.answer("Сначала настройте профиль с помощью команды /set_profile.")
         return
 
-    # Извлечение данных пользователя
-    user_data = users[user_id]
-    water_consumed = user_data["logged_water"]
-    water_goal = user_data["water_goal"]
+    # Извлечение данных пользователя (после полуночи - уже за новый день)
+    rollover_scheduler.ensure_current(user_id)
+    user = users.get(user_id)
+    water_consumed = user.logged_water
+    water_goal = user.water_goal
     water_remaining = max(0, water_goal - water_consumed)
 
-    calories_consumed = user_data["logged_calories"]
-    calorie_goal = user_data["calorie_goal"]
-    calories_burned = user_data["burned_calories"]
+    calories_consumed = user.logged_calories
+    calorie_goal = user.calorie_goal
+    calories_burned = user.burned_calories
     calorie_balance = calories_consumed - calories_burned
 
     # Формирование сообщения
@@ -336,6 +331,30 @@ async def cmd_check_progress(message: Message):
     await message.answer(progress_message, parse_mode="HTML")
 
 
+# ХЭНДЛЕР /history (История по дням)
+@router.message(Command("history"))
+async def cmd_history(message: Message):
+    user_id = message.from_user.id
+    if user_id not in users:
+        await message.answer("Сначала настройте профиль с помощью команды /set_profile.")
+        return
+
+    parts = message.text.split()
+    if len(parts) > 2 or (len(parts) == 2 and parts[1] not in ("7", "30")):
+        await message.answer("Укажите период: 7 или 30 дней. Пример: /history 30")
+        return
+    days = int(parts[1]) if len(parts) == 2 else 7
+
+    # Данные берутся из дневных сводок, без повторного чтения журнала событий; дни - местные, как у /check_progress
+    today = rollover_scheduler.local_day(users.get(user_id))
+    lines = [f"<b>История за {days} дней:</b>\n"]
+    for day, water, calories, burned in event_log.history(user_id, days, today):
+        day_label = day_to_date(day).strftime("%d.%m")
+        lines.append(f"{day_label}: вода {water:.0f} мл, еда {calories:.0f} ккал, сожжено {burned:.0f} ккал")
+
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
 # ХЭНДЛЕР /progress_charts (Графики прогресса по воде и калориям)
 @router.message(Command("progress_charts"))
 async def cmd_progress_charts(message: Message):
@@ -355,26 +374,41 @@ async def handle_chart_selection(callback: CallbackQuery):
         await callback.message.answer("Сначала настройте профиль с помощью команды /set_profile.")
         return
 
-    user_data = users[user_id]
+    user = users.get(user_id)
+
+    chart_type = "water" if callback.data == "chart_water" else "calories"
+    caption = "Прогресс по воде" if chart_type == "water" else "Прогресс по калориям"
+    values = chart_values(user)
 
-    # Генерация и отправка соответствующего графика
-    if callback.data == "chart_water":
-        water_chart, _ = generate_progress_charts(user_data, user_id)
-        await callback.message.answer_photo(FSInputFile(water_chart), caption="Прогресс по воде")
-        os.remove(water_chart)
+    # Если такой же график уже отправлялся, пересылаем его по file_id без отрисовки и загрузки
+    key = chart_key(values, chart_type)
+    file_id = chart_cache.lookup(key)
+    if file_id is not None:
+        try:
+            await callback.message.answer_photo(file_id, caption=caption)
+            await callback.answer("График отправлен!")
+            return
+        except TelegramBadRequest:
+            chart_cache.pop(key)
+
+    # Генерация и отправка только выбранного графика (в пуле, без записи на диск)
+    try:
+        chart = await chart_renderer.render(values, chart_type)
+    except ChartQueueFull:
+        await callback.answer("Сейчас слишком много запросов, попробуйте чуть позже.", show_alert=True)
+        return
 
-    elif callback.data == "chart_calories":
-        _, calorie_chart = generate_progress_charts(user_data, user_id)
-        await callback.message.answer_photo(FSInputFile(calorie_chart), caption="Прогресс по калориям")
-        os.remove(calorie_chart)
+    sent = await callback.message.answer_photo(BufferedInputFile(chart, filename=f"{chart_type}_progress.png"),
+                                               caption=caption)
+    chart_cache.set(key, sent.photo[-1].file_id)
 
-        # Уведомление об обработке выбора
+    # Уведомление об обработке выбора
     await callback.answer("График отправлен!")
 
 
 # ХЭНДЛЕР /update_weight (Обновление веса)
 @router.message(Command("update_weight"))
-async def update_weight(message: Message):
+async def update_weight(message: Message, http_session: aiohttp.ClientSession):
     parts = message.text.split()
     if len(parts) != 2 or not parts[1].isdigit():
         await message.answer("Укажите ваш вес в формате: /update_weight <вес в кг>.")
@@ -383,9 +417,23 @@ async def update_weight(message: Message):
     user_id = message.from_user.id
     new_weight = float(message.text.split()[1])
 
-    if user_id in users:
-        users[user_id]["weight"] = new_weight
-        await message.answer(f"Ваш вес обновлён: {new_weight} кг.")
+    user = users.get(user_id)
+    if user is not None:
+        # Нормы зависят от веса, поэтому пересчитываем их сразу
+        temperature = await weather_cache.get_temperature(user.city, http_session)
+        # Без температуры норму воды не трогаем, как и при пакетном пересчете (goals.py): бонус за жару
+        # нельзя ни подтвердить, ни снять
+        if temperature is None:
+            water_goal = user.water_goal
+        else:
+            water_goal = calculate_water_goal(new_weight, user.activity, temperature)
+        calorie_goal = calculate_calorie_goal(new_weight, user.height, user.age, user.activity)
+        user = users.update(user_id, weight=new_weight, water_goal=water_goal, calorie_goal=calorie_goal)
+        await message.answer(
+            f"Ваш вес обновлён: {new_weight} кг.\n"
+            f"Цель по воде: {user.water_goal} мл\n"
+            f"Цель по калориям: {user.calorie_goal} ккал"
+        )
     else:
         await message.answer("Сначала настройте профиль с помощью команды /set_profile.")
 
@@ -395,7 +443,9 @@ async def update_weight(message: Message):
 async def reset_profile(message: Message):
     user_id = message.from_user.id
     if user_id in users:
-        del users[user_id]
+        users.delete(user_id)
+        # История прежнего профиля не должна достаться новому
+        event_log.append(user_id, RESET, 0)
         await message.answer("Ваш профиль был сброшен. Вы можете настроить его заново через /set_profile.")
     else:
         await message.answer("У вас пока нет настроенного профиля.")
@@ -0,0 +1,308 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import aiohttp
+from config import (HTTP_TOTAL_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST,
+                    HTTP_KEEPALIVE_TIMEOUT, HTTP_DNS_CACHE_TTL, UPSTREAM_LIMITS, UPSTREAM_DEADLINES, UPSTREAM_RETRIES,
+                    UPSTREAM_BACKOFF, UPSTREAM_BREAKER, UPSTREAM_HEDGE)
+from metrics import create_trace_config
+
+
+# Создание общего HTTP-клиента с пулом соединений (один на процесс)
+def create_http_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[create_trace_config()])
+
+
+# Открытие HTTP-клиента при запуске диспетчера
+async def on_startup(dispatcher):
+    dispatcher["http_session"] = create_http_session()
+
+
+# Закрытие HTTP-клиента при остановке диспетчера
+async def on_shutdown(dispatcher):
+    session = dispatcher.workflow_data.pop("http_session", None)
+    if session is not None:
+        await session.close()
+
+
+# Ошибка внешнего API (неуспешный статус ответа)
+class UpstreamError(Exception):
+    def __init__(self, service: str, status: int, message: str = None):
+        super().__init__(message or f"{service} responded with status {status}")
+        self.service = service
+        self.status = status
+
+
+# Внешний API не ответил до истечения предельного времени вызова
+class UpstreamTimeout(UpstreamError):
+    def __init__(self, service: str, deadline: float):
+        super().__init__(service, None, f"{service} did not respond within {deadline:g} s")
+
+
+# Цепь к внешнему API разомкнута после серии неудач: запрос отклонен без обращения к сервису
+class UpstreamUnavailable(UpstreamError):
+    def __init__(self, service: str):
+        super().__init__(service, None, f"{service} is unavailable (circuit open)")
+
+
+# Внешний API перегружен: очередь ожидания заполнена, запрос отклонен
+class UpstreamBusy(Exception):
+    def __init__(self, service: str):
+        super().__init__(f"{service} concurrency limit reached")
+        self.service = service
+
+
+# Ограничение числа одновременных запросов к внешнему API с очередью ограниченной длины
+class UpstreamLimiter:
+    def __init__(self, service: str, limit: int, max_waiting: int):
+        self.service = service
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise UpstreamBusy(self.service)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+
+
+# Разбор настройки вида "fdc:10/50" -> {сервис: (лимит, длина очереди)}
+def parse_limits(spec: str) -> dict:
+    limits = {}
+    for item in spec.split(","):
+        service, limit = item.strip().split(":")
+        concurrency, waiting = limit.split("/")
+        limits[service] = (int(concurrency), int(waiting))
+    return limits
+
+
+upstream_limiters = {service: UpstreamLimiter(service, limit, waiting)
+                     for service, (limit, waiting) in parse_limits(UPSTREAM_LIMITS).items()}
+
+
+# Разбор настройки вида "fdc:5,nutritionix:3" -> {сервис: секунды}
+def parse_deadlines(spec: str) -> dict:
+    deadlines = {}
+    for item in spec.split(","):
+        service, seconds = item.strip().split(":")
+        deadlines[service] = float(seconds)
+    return deadlines
+
+
+# Размыкатель цепи: closed -> (threshold неудач подряд) -> open -> (reset_timeout) -> half-open -> closed/open.
+# В состоянии half-open к сервису пропускается один пробный вызов
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+
+    # Можно ли обращаться к сервису сейчас
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    # Вызов не дошел до сервиса (например, отклонен локальным лимитом): пробный слот освобождается
+    def record_skipped(self):
+        self._probing = False
+
+
+# Задержки последних успешных ответов сервиса для порога дублирующего запроса
+class LatencyWindow:
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    # p95 задержки или None, пока ответов слишком мало
+    def p95(self):
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95)]
+
+
+# Общий слой вызовов внешнего API: лимит одновременных запросов, предельное время, повторы GET со случайной паузой,
+# размыкатель цепи и дублирующий запрос после p95. request() - корутина одного запроса, которая возвращает
+# разобранный ответ или бросает UpstreamError/aiohttp.ClientError
+class Upstream:
+    def __init__(self, service: str, limiter: UpstreamLimiter, deadline: float, retries: int, backoff: float,
+                 breaker: CircuitBreaker, hedge: bool):
+        self.service = service
+        self.limiter = limiter
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.hedge = hedge
+        self.latency = LatencyWindow()
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.hedged = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+
+    # Вызов с учетом всех политик; idempotent=False (POST) - без повторов и дублирования
+    async def call(self, request, idempotent: bool = True):
+        self.calls += 1
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise UpstreamUnavailable(self.service)
+        try:
+            result = await self._call(request, idempotent)
+        except (UpstreamBusy, asyncio.CancelledError):
+            self.breaker.record_skipped()
+            raise
+        except Exception as e:
+            if self._retryable(e):
+                self.failures += 1
+                self.breaker.record_failure()
+            elif isinstance(e, UpstreamError):
+                # Сервис ответил (например, 404): он исправен, ошибка относится к запросу
+                self.breaker.record_success()
+            else:
+                self.breaker.record_skipped()
+            raise
+        self.breaker.record_success()
+        return result
+
+    # Повторять имеет смысл только таймауты, ошибки соединения и 5xx
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, UpstreamError):
+            return error.status is None or error.status >= 500
+        return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+    async def _call(self, request, idempotent: bool):
+        attempts = self.retries + 1 if idempotent else 1
+        # Попытки и паузы между ними укладываются в предельное время вызова. Попытке достается весь остаток,
+        # чтобы медленный, но исправный ответ не обрывался и не считался сбоем
+        deadline_at = time.monotonic() + self.deadline
+        for attempt in range(attempts):
+            try:
+                return await asyncio.wait_for(self._attempt(request, idempotent and self.hedge),
+                                              deadline_at - time.monotonic())
+            except Exception as e:
+                # Истекло предельное время вызова (а не таймаут чтения самого aiohttp, который можно повторить)
+                if isinstance(e, asyncio.TimeoutError) and time.monotonic() >= deadline_at:
+                    self.timeouts += 1
+                    raise UpstreamTimeout(self.service, self.deadline) from None
+                if not self._retryable(e) or attempt + 1 == attempts:
+                    raise
+                pause = random.uniform(0, self.backoff * 2 ** attempt)
+                # Повтор, который не успеет начаться до истечения предельного времени, не нужен
+                if time.monotonic() + pause >= deadline_at:
+                    raise
+            self.retried += 1
+            await asyncio.sleep(pause)
+
+    # Одна попытка; при hedge второй такой же запрос уходит, если первый идет дольше p95. Побеждает первый успех
+    async def _attempt(self, request, hedge: bool):
+        tasks = [asyncio.ensure_future(self._send(request))]
+        try:
+            delay = self.latency.p95() if hedge else None
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    tasks.append(asyncio.ensure_future(self._send(request)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _send(self, request):
+        async with self.limiter:
+            start = time.perf_counter()
+            result = await request()
+            self.latency.add(time.perf_counter() - start)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            **self.limiter.stats(),
+            "calls": self.calls,
+            "failures": self.failures,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "timeouts": self.timeouts,
+            "short_circuited": self.short_circuited,
+            "circuit_state": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+        }
+
+
+def create_upstreams(limiters: dict) -> dict:
+    deadlines = parse_deadlines(UPSTREAM_DEADLINES)
+    threshold, reset_timeout = UPSTREAM_BREAKER.split("/")
+    return {service: Upstream(service, limiter, deadlines.get(service, HTTP_TOTAL_TIMEOUT), UPSTREAM_RETRIES,
+                              UPSTREAM_BACKOFF, CircuitBreaker(int(threshold), float(reset_timeout)), UPSTREAM_HEDGE)
+            for service, limiter in limiters.items()}
+
+
+upstreams = create_upstreams(upstream_limiters)
@@ -0,0 +1,196 @@
+import random
+import time
+from bisect import bisect_left
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT, METRICS_SAMPLE_RATE
+from config import OPENWEATHER_API_URL, FOOD_DATA_CENTRAL_API_URL, NUTRITIONIX_API_URL
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(labelnames, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Счетчик с метками
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+# Гистограмма с фиксированными границами корзин
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}  # метки -> [счетчики по корзинам..., сумма, количество]
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+# Показатели, значения которых читаются из stats() компонентов в момент выгрузки
+class StatsGauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label: str, sources: dict):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.sources = sources  # значение метки -> функция, возвращающая словарь показателей
+
+    def samples(self):
+        for source, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, dict):
+                    for sub_key, sub_value in value.items():
+                        labels = [(self.label, source), ("stat", f"{key}_{sub_key}")]
+                        yield f"{self.name}{_format_labels((), (), labels)} {sub_value}"
+                else:
+                    yield f"{self.name}{_format_labels((), (), [(self.label, source), ('stat', key)])} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # Выгрузка всех показателей в текстовом формате Prometheus
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Handler processing time", ("handler",)))
+HANDLER_CALLS = registry.register(Counter(
+    "bot_handler_calls_total", "Handler invocations", ("handler",)))
+HANDLER_ERRORS = registry.register(Counter(
+    "bot_handler_errors_total", "Handler exceptions", ("handler", "error")))
+FSM_TRANSITIONS = registry.register(Counter(
+    "bot_fsm_transitions_total", "FSM state transitions", ("from_state", "to_state")))
+UPSTREAM_LATENCY = registry.register(Histogram(
+    "bot_upstream_duration_seconds", "External API call time", ("service",)))
+UPSTREAM_RESPONSES = registry.register(Counter(
+    "bot_upstream_responses_total", "External API responses by status", ("service", "status")))
+CHART_RENDER_LATENCY = registry.register(Histogram(
+    "bot_chart_render_seconds", "Chart rendering time", ("chart",)))
+COMPONENT_STATS = registry.register(StatsGauge(
+    "bot_component_stat", "Internal component counters (caches, limiters, queues)", "component", {}))
+
+
+# Регистрация stats() компонента для выгрузки
+def register_stats(component: str, stats):
+    COMPONENT_STATS.sources[component] = stats
+
+
+# Выборка для гистограмм задержки (счетчики вызовов и ошибок считаются всегда)
+def sampled() -> bool:
+    return METRICS_SAMPLE_RATE >= 1 or random.random() < METRICS_SAMPLE_RATE
+
+
+# Определение внешнего сервиса по хосту запроса
+UPSTREAM_HOSTS = {
+    URL(OPENWEATHER_API_URL).host: "openweathermap",
+    URL(FOOD_DATA_CENTRAL_API_URL).host: "fdc",
+    URL(NUTRITIONIX_API_URL).host: "nutritionix",
+}
+
+
+# Трассировка запросов общего HTTP-клиента: длительность и статус ответа по сервисам
+def create_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        service = UPSTREAM_HOSTS.get(params.url.host, params.url.host)
+        UPSTREAM_LATENCY.observe(time.perf_counter() - context.start, service)
+        UPSTREAM_RESPONSES.inc(service, params.response.status)
+
+    async def on_request_exception(session, context, params):
+        service = UPSTREAM_HOSTS.get(params.url.host, params.url.host)
+        UPSTREAM_LATENCY.observe(time.perf_counter() - context.start, service)
+        UPSTREAM_RESPONSES.inc(service, type(params.exception).__name__)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+async def handle_metrics(request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+_runner = None
+
+
+# HTTP-эндпоинт /metrics запускается вместе с диспетчером
+async def on_startup():
+    global _runner
+    if not METRICS_ENABLED or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_HOST, METRICS_PORT).start()
+
+
+async def on_shutdown():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -1,7 +1,115 @@
+import time
+
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import CallbackQuery
+
+from config import THROTTLE_RATES, THROTTLE_SWEEP_INTERVAL
+from metrics import HANDLER_LATENCY, HANDLER_CALLS, HANDLER_ERRORS, FSM_TRANSITIONS, sampled
+
+
+# Инструментирование хэндлеров: задержка, ошибки и переходы состояний FSM (без текста сообщений)
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data: dict):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        state = data.get("state")
+        before = data.get("raw_state")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_CALLS.inc(name)
+            if sampled():
+                HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+            if state is not None:
+                after = await state.get_state()
+                if after != before:
+                    FSM_TRANSITIONS.inc(before or "none", after or "none")
+
+
+# Класс команды для ограничения частоты (у каждого класса свое ведро токенов)
+COMMAND_CLASSES = {
+    "/log_food": "food",
+    "/log_workout": "workout",
+}
+
+
+# Разбор настройки вида "food:5/60,workout:5/60,default:30/60" -> {класс: (емкость, токенов в секунду)}
+def parse_rates(spec: str) -> dict:
+    rates = {}
+    for item in spec.split(","):
+        name, rate = item.strip().split(":")
+        capacity, period = rate.split("/")
+        rates[name] = (float(capacity), float(capacity) / float(period))
+    return rates
+
 
-class LoggingMiddleware(BaseMiddleware):
-    async def __call__(self, handler, event: Message, data: dict):
-        print(f"Получено сообщение: {event.text}")
+# Ограничение частоты запросов пользователя: ведро токенов на пару (пользователь, класс команды)
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, rates: str = THROTTLE_RATES, sweep_interval: float = THROTTLE_SWEEP_INTERVAL):
+        self.rates = parse_rates(rates)
+        self.sweep_interval = sweep_interval
+        self._buckets = {}  # (user_id, класс) -> [токены, время обновления, предупрежден]
+        self._last_sweep = time.monotonic()
+        self.allowed = {name: 0 for name in self.rates}
+        self.throttled = {name: 0 for name in self.rates}
+        self.evicted = 0
+
+    def command_class(self, event) -> str:
+        if isinstance(event, CallbackQuery):
+            name = "chart"
+        else:
+            parts = (event.text or "").split(maxsplit=1)
+            name = COMMAND_CLASSES.get(parts[0].split("@")[0] if parts else "", "default")
+        return name if name in self.rates else "default"
+
+    # Удаление ведер, которые за время простоя успели наполниться целиком
+    def _sweep(self, now: float):
+        self._last_sweep = now
+        idle = [key for key, (tokens, updated, _) in self._buckets.items()
+                if tokens + (now - updated) * self.rates[key[1]][1] >= self.rates[key[1]][0]]
+        for key in idle:
+            del self._buckets[key]
+        self.evicted += len(idle)
+
+    async def __call__(self, handler, event, data: dict):
+        if event.from_user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        if now - self._last_sweep > self.sweep_interval:
+            self._sweep(now)
+
+        name = self.command_class(event)
+        capacity, refill = self.rates[name]
+        key = (event.from_user.id, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now, False]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            self.throttled[name] += 1
+            # Предупреждаем один раз, остальные запросы до пополнения ведра молча отбрасываются
+            if not bucket[2]:
+                bucket[2] = True
+                text = "Слишком много запросов. Попробуйте чуть позже."
+                if isinstance(event, CallbackQuery):
+                    await event.answer(text, show_alert=True)
+                else:
+                    await event.answer(text)
+            return None
+
+        bucket[0] -= 1
+        bucket[2] = False
+        self.allowed[name] += 1
         return await handler(event, data)
+
+    def stats(self) -> dict:
+        return {"buckets": len(self._buckets), "allowed": dict(self.allowed),
+                "throttled": dict(self.throttled), "evicted": self.evicted}
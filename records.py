@@ -0,0 +1,55 @@
+# Целые поля хранятся целыми даже после расчетов во float (нормы воды и т.п.)
+def to_int(value) -> int:
+    return int(round(value))
+
+
+# Поля профиля и дневных счетчиков с фиксированными типами.
+# timezone = "" - часовой пояс определяется по городу, day = 0 - день счетчиков еще не назначен.
+FIELDS = {
+    "weight": float,
+    "height": to_int,
+    "age": to_int,
+    "activity": to_int,
+    "city": str,
+    "timezone": str,
+    "water_goal": to_int,
+    "calorie_goal": float,
+    "logged_water": to_int,
+    "logged_calories": float,
+    "burned_calories": float,
+    "day": to_int,
+}
+
+
+# Профиль и счетчики пользователя: слоты вместо словаря, типы полей приводятся при записи
+class UserRecord:
+    __slots__ = tuple(FIELDS)
+
+    def __init__(self, weight, height, age, activity, city, timezone="", water_goal=0, calorie_goal=0.0,
+                 logged_water=0, logged_calories=0.0, burned_calories=0.0, day=0):
+        self.weight = float(weight)
+        self.height = to_int(height)
+        self.age = to_int(age)
+        self.activity = to_int(activity)
+        self.city = str(city)
+        self.timezone = str(timezone)
+        self.water_goal = to_int(water_goal)
+        self.calorie_goal = float(calorie_goal)
+        self.logged_water = to_int(logged_water)
+        self.logged_calories = float(logged_calories)
+        self.burned_calories = float(burned_calories)
+        self.day = to_int(day)
+
+    def set(self, field: str, value):
+        setattr(self, field, FIELDS[field](value))
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in FIELDS}
+
+    # Из словаря (JSON в SQLite или профиль старого формата); лишние ключи игнорируются
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**{field: data[field] for field in FIELDS if data.get(field) is not None})
+
+    def __repr__(self):
+        return f"UserRecord({', '.join(f'{field}={getattr(self, field)!r}' for field in FIELDS)})"
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from broadcast import broadcaster
+from config import REMINDER_HOUR, REMINDER_THRESHOLD, BROADCAST_DIR
+from rollover import record_timezone
+from storage import owns, users
+
+
+# Напоминания о воде. Отстающие пользователи (выпито меньше доли нормы) хранятся в наборах
+# по часовым поясам и обновляются при каждом изменении профиля, поэтому в час рассылки
+# получатели берутся готовыми, без прохода по всем профилям.
+class WaterReminders:
+    def __init__(self, store, broadcaster, hour: int, threshold: float, state_path: str):
+        self.store = store
+        self.broadcaster = broadcaster
+        self.hour = hour
+        self.threshold = threshold
+        self.state_path = state_path
+        self._behind = {}  # часовой пояс -> {user_id}
+        self._timezones = {}  # user_id -> часовой пояс, в наборе которого он сейчас
+        self._sent = {}  # часовой пояс -> дата последней рассылки
+        self._task = None
+        self.broadcasts = 0
+        store.subscribe(self.track)
+        broadcaster.register("water", self.render)
+
+    def is_behind(self, record) -> bool:
+        return record.logged_water < record.water_goal * self.threshold
+
+    # Учитываются только пользователи этого воркера: остальным напоминают их воркеры
+    def track(self, user_id: int, record):
+        timezone = self._timezones.pop(user_id, None)
+        if timezone is not None:
+            self._behind[timezone].discard(user_id)
+        if record is None or not owns(user_id) or not self.is_behind(record):
+            return
+        timezone = record_timezone(record)
+        self._timezones[user_id] = timezone
+        self._behind.setdefault(timezone, set()).add(user_id)
+
+    # Начальное заполнение наборов: один проход по профилям при старте
+    def build(self):
+        user_ids, records = self.store.snapshot()
+        for user_id, record in zip(user_ids, records):
+            self.track(user_id, record)
+
+    def render(self, user_id: int):
+        record = self.store.get(user_id)
+        # Пока сообщение ждало очереди, пользователь мог выпить воду или удалить профиль
+        if record is None or not self.is_behind(record):
+            return None
+        remaining = max(0, record.water_goal - record.logged_water)
+        return (f"Не забывайте пить воду! Сегодня выпито {record.logged_water} мл "
+                f"из {record.water_goal} мл, осталось {remaining} мл.")
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                self._sent = json.load(f)
+        except FileNotFoundError:
+            self._sent = {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path + ".tmp", "w") as f:
+            json.dump(self._sent, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    # Рассылка по часовым поясам, где наступил час напоминания и сегодня еще не было рассылки
+    def check(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        submitted = 0
+        for timezone, targets in self._behind.items():
+            local = datetime.fromtimestamp(now, ZoneInfo(timezone))
+            today = local.date().isoformat()
+            if local.hour != self.hour or self._sent.get(timezone) == today:
+                continue
+            if targets:
+                self.broadcaster.submit("water", sorted(targets))
+                submitted += len(targets)
+                self.broadcasts += 1
+            self._sent[timezone] = today
+        if submitted:
+            self._save_state()
+        return submitted
+
+    async def run(self):
+        self._load_state()
+        self.build()
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                # Например, OSError при записи задания: в следующую минуту того же часа попытка повторится
+                print(f"Ошибка напоминаний о воде: {e!r}")
+            await asyncio.sleep(60 - time.time() % 60)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"behind": len(self._timezones), "broadcasts": self.broadcasts}
+
+
+water_reminders = WaterReminders(users, broadcaster, REMINDER_HOUR, REMINDER_THRESHOLD,
+                                 os.path.join(BROADCAST_DIR, "reminders.json"))
+
+
+async def on_startup():
+    water_reminders.start()
+
+
+async def on_shutdown():
+    await water_reminders.stop()
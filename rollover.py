@@ -0,0 +1,298 @@
+import asyncio
+import math
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from cache import normalize_query
+from config import ROLLOVER_TICK, ROLLOVER_BATCH, DEFAULT_TIMEZONE, DAY_ARCHIVE_PATH
+from events import EPOCH
+from storage import users
+
+# Часовые пояса городов (русские и английские названия); остальные получают DEFAULT_TIMEZONE
+CITY_TIMEZONES = {
+    "москва": "Europe/Moscow", "moscow": "Europe/Moscow",
+    "санкт-петербург": "Europe/Moscow", "петербург": "Europe/Moscow", "спб": "Europe/Moscow",
+    "saint petersburg": "Europe/Moscow", "st petersburg": "Europe/Moscow",
+    "казань": "Europe/Moscow", "kazan": "Europe/Moscow",
+    "нижний новгород": "Europe/Moscow", "nizhny novgorod": "Europe/Moscow",
+    "воронеж": "Europe/Moscow", "voronezh": "Europe/Moscow",
+    "ростов-на-дону": "Europe/Moscow", "rostov-on-don": "Europe/Moscow",
+    "краснодар": "Europe/Moscow", "krasnodar": "Europe/Moscow",
+    "сочи": "Europe/Moscow", "sochi": "Europe/Moscow",
+    "калининград": "Europe/Kaliningrad", "kaliningrad": "Europe/Kaliningrad",
+    "самара": "Europe/Samara", "samara": "Europe/Samara",
+    "саратов": "Europe/Saratov", "saratov": "Europe/Saratov",
+    "волгоград": "Europe/Volgograd", "volgograd": "Europe/Volgograd",
+    "екатеринбург": "Asia/Yekaterinburg", "yekaterinburg": "Asia/Yekaterinburg",
+    "челябинск": "Asia/Yekaterinburg", "chelyabinsk": "Asia/Yekaterinburg",
+    "пермь": "Asia/Yekaterinburg", "perm": "Asia/Yekaterinburg",
+    "уфа": "Asia/Yekaterinburg", "ufa": "Asia/Yekaterinburg",
+    "тюмень": "Asia/Yekaterinburg", "tyumen": "Asia/Yekaterinburg",
+    "омск": "Asia/Omsk", "omsk": "Asia/Omsk",
+    "новосибирск": "Asia/Novosibirsk", "novosibirsk": "Asia/Novosibirsk",
+    "красноярск": "Asia/Krasnoyarsk", "krasnoyarsk": "Asia/Krasnoyarsk",
+    "иркутск": "Asia/Irkutsk", "irkutsk": "Asia/Irkutsk",
+    "якутск": "Asia/Yakutsk", "yakutsk": "Asia/Yakutsk",
+    "хабаровск": "Asia/Vladivostok", "khabarovsk": "Asia/Vladivostok",
+    "владивосток": "Asia/Vladivostok", "vladivostok": "Asia/Vladivostok",
+    "магадан": "Asia/Magadan", "magadan": "Asia/Magadan",
+    "петропавловск-камчатский": "Asia/Kamchatka", "petropavlovsk-kamchatsky": "Asia/Kamchatka",
+    "минск": "Europe/Minsk", "minsk": "Europe/Minsk",
+    "киев": "Europe/Kiev", "kyiv": "Europe/Kiev", "kiev": "Europe/Kiev",
+    "алматы": "Asia/Almaty", "almaty": "Asia/Almaty",
+    "астана": "Asia/Almaty", "astana": "Asia/Almaty",
+    "ташкент": "Asia/Tashkent", "tashkent": "Asia/Tashkent",
+    "бишкек": "Asia/Bishkek", "bishkek": "Asia/Bishkek",
+    "тбилиси": "Asia/Tbilisi", "tbilisi": "Asia/Tbilisi",
+    "ереван": "Asia/Yerevan", "yerevan": "Asia/Yerevan",
+    "баку": "Asia/Baku", "baku": "Asia/Baku",
+    "стамбул": "Europe/Istanbul", "istanbul": "Europe/Istanbul",
+    "лондон": "Europe/London", "london": "Europe/London",
+    "париж": "Europe/Paris", "paris": "Europe/Paris",
+    "берлин": "Europe/Berlin", "berlin": "Europe/Berlin",
+    "дубай": "Asia/Dubai", "dubai": "Asia/Dubai",
+    "пекин": "Asia/Shanghai", "beijing": "Asia/Shanghai",
+    "токио": "Asia/Tokyo", "tokyo": "Asia/Tokyo",
+    "нью-йорк": "America/New_York", "new york": "America/New_York",
+    "лос-анджелес": "America/Los_Angeles", "los angeles": "America/Los_Angeles",
+}
+
+# Запись архива: user_id, локальный день (от начала эпохи), вода, калории, сожжено
+DAY_TOTALS = struct.Struct("<qifff")
+
+
+def city_timezone(city: str) -> str:
+    return CITY_TIMEZONES.get(normalize_query(city).replace("ё", "е"), DEFAULT_TIMEZONE)
+
+
+# Часовой пояс профиля (у старых профилей его нет - определяем по городу)
+def record_timezone(record) -> str:
+    return record.timezone or city_timezone(record.city)
+
+
+# ZoneInfo по имени часового пояса; неизвестные имена - DEFAULT_TIMEZONE
+def _zone(timezone: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+# Сдвиг местного времени пользователя от UTC в секундах (для журнала событий: события раскладываются по местным дням)
+def utc_offset(record, now: float = None) -> int:
+    moment = datetime.fromtimestamp(time.time() if now is None else now, _zone(record_timezone(record)))
+    return int(moment.utcoffset().total_seconds())
+
+
+# Архив дневных итогов только на дозапись
+class DayArchive:
+    def __init__(self, path: str):
+        self.path = path
+        self._buffer = bytearray()
+        self._file = None
+
+    def append(self, user_id: int, day: int, water, calories, burned):
+        self._buffer += DAY_TOTALS.pack(user_id, day, water, calories, burned)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def records(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        return list(DAY_TOTALS.iter_unpack(data[:len(data) - len(data) % DAY_TOTALS.size]))
+
+
+# Хэшированное колесо таймеров: слот на каждый шаг, один оборот - slots шагов.
+# Таймеры дальше одного оборота остаются в слоте до следующего прохода.
+class TimerWheel:
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [[] for _ in range(slots)]
+        self._current = None  # номер последнего обработанного шага
+        self.size = 0
+
+    def schedule(self, deadline: float, item):
+        tick = int(deadline // self.tick)
+        if self._current is not None:
+            tick = max(tick, self._current + 1)
+        self._wheel[tick % self.slots].append((deadline, item))
+        self.size += 1
+
+    # Все таймеры со сроком не позже now: список (срок, элемент)
+    def advance(self, now: float):
+        target = int(now // self.tick)
+        if self._current is None:
+            self._current = target - 1
+        due = []
+        # После долгого простоя достаточно одного оборота: каждый слот просматривается один раз
+        for tick in range(max(self._current + 1, target - self.slots + 1), target + 1):
+            slot = self._wheel[tick % self.slots]
+            if not slot:
+                continue
+            pending = []
+            for entry in slot:
+                (due if entry[0] <= now else pending).append(entry)
+            self._wheel[tick % self.slots] = pending
+        self._current = max(self._current, target)
+        self.size -= len(due)
+        return due
+
+
+# Ежедневный сброс счетчиков: в полночь по времени пользователя итоги дня уходят в архив,
+# а счетчики обнуляются пачками. Пропущенные за время простоя сбросы выполняются при старте.
+class RolloverScheduler:
+    def __init__(self, store, archive: DayArchive, tick: float, batch: int):
+        self.store = store
+        self.archive = archive
+        self.batch = batch
+        # Оборот колеса - двое суток: любая следующая полночь (в том числе при переводе часов)
+        # срабатывает на первом же проходе слота
+        self.wheel = TimerWheel(tick, math.ceil(2 * 86400 / tick))
+        self._deadlines = {}  # user_id -> срок, под которым пользователь сейчас стоит в колесе
+        self._midnights = {}  # часовой пояс -> (локальный день, ближайшая полночь по UTC)
+        self._task = None
+        self.rolled = 0
+        self.recovered = 0
+        self.last_tick_duration = 0.0
+
+    # Локальный день и время следующей полночи по часовому поясу (кэшируется до этой полночи)
+    def _midnight(self, timezone: str, now: float):
+        cached = self._midnights.get(timezone)
+        if cached is not None and now < cached[1]:
+            return cached
+        zone = _zone(timezone)
+        today = datetime.fromtimestamp(now, zone).date()
+        midnight = datetime.combine(today + timedelta(days=1), datetime.min.time(), zone).timestamp()
+        cached = self._midnights[timezone] = ((today - EPOCH).days, midnight)
+        return cached
+
+    def local_day(self, record, now: float = None) -> int:
+        return self._midnight(record_timezone(record), time.time() if now is None else now)[0]
+
+    def schedule(self, user_id: int, record, now: float = None):
+        deadline = self._midnight(record_timezone(record), time.time() if now is None else now)[1]
+        if self._deadlines.get(user_id) != deadline:
+            self._deadlines[user_id] = deadline
+            self.wheel.schedule(deadline, user_id)
+
+    # Перенос итогов в архив и обнуление счетчиков, если день пользователя уже закончился
+    def _roll(self, user_id: int, record, now: float) -> bool:
+        today = self.local_day(record, now)
+        day = record.day
+        if day >= today:
+            return False
+        if day:
+            self.archive.append(user_id, day, record.logged_water, record.logged_calories, record.burned_calories)
+            self.store.update(user_id, logged_water=0, logged_calories=0, burned_calories=0, day=today)
+        else:
+            # Профиль без дня (создан до сброса по полуночи): счетчики считаем сегодняшними
+            self.store.update(user_id, day=today)
+        return bool(day)
+
+    # Сброс при обращении: вызывается перед изменением счетчиков. Иначе записи между полуночью и ближайшим шагом
+    # колеса (до ROLLOVER_TICK секунд) или сделанные, пока идет восстановление при старте, попали бы в прошлый день
+    def ensure_current(self, user_id: int, now: float = None) -> bool:
+        record = self.store.get(user_id)
+        if record is None:
+            return False
+        now = time.time() if now is None else now
+        rolled = self._roll(user_id, record, now)
+        if rolled:
+            self.rolled += 1
+        self.schedule(user_id, record, now)
+        return rolled
+
+    async def _process(self, user_ids, records, now: float) -> int:
+        rolled = 0
+        for start in range(0, len(user_ids), self.batch):
+            for user_id, record in zip(user_ids[start:start + self.batch], records[start:start + self.batch]):
+                if record is None:
+                    self._deadlines.pop(user_id, None)
+                    continue
+                deadline = self._deadlines.get(user_id)
+                if deadline is not None and deadline > now:
+                    # Пользователь уже сброшен при обращении, пока шло восстановление: запись из снимка устарела
+                    continue
+                if self._roll(user_id, record, now):
+                    rolled += 1
+                self.schedule(user_id, record, now)
+            self.archive.flush()
+            # Пачка обработана: отдаем управление обработке апдейтов
+            await asyncio.sleep(0)
+        return rolled
+
+    # Восстановление после простоя: один проход по всем профилям при старте
+    async def recover(self, now: float = None):
+        now = time.time() if now is None else now
+        user_ids, records = self.store.snapshot()
+        self.recovered += await self._process(user_ids, records, now)
+
+    # Шаг колеса: сбрасываются только пользователи, чья полночь наступила
+    async def tick(self, now: float = None):
+        now = time.time() if now is None else now
+        begin = time.perf_counter()
+        user_ids = [user_id for deadline, user_id in self.wheel.advance(now)
+                    if self._deadlines.get(user_id) == deadline]
+        for user_id in user_ids:
+            del self._deadlines[user_id]
+        records = [self.store.get(user_id) for user_id in user_ids]
+        self.rolled += await self._process(user_ids, records, now)
+        self.last_tick_duration = time.perf_counter() - begin
+
+    async def run(self):
+        await self.recover()
+        while True:
+            await asyncio.sleep(self.wheel.tick - time.time() % self.wheel.tick)
+            await self.tick()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.archive.close()
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._deadlines),
+            "wheel_entries": self.wheel.size,
+            "rolled": self.rolled,
+            "recovered": self.recovered,
+            "last_tick_duration": self.last_tick_duration,
+        }
+
+
+rollover_scheduler = RolloverScheduler(users, DayArchive(DAY_ARCHIVE_PATH), ROLLOVER_TICK, ROLLOVER_BATCH)
+
+
+async def on_startup():
+    rollover_scheduler.start()
+
+
+async def on_shutdown():
+    await rollover_scheduler.stop()
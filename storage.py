@@ -0,0 +1,428 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from config import USER_STORE, USER_DB_PATH, USER_STORE_FLUSH_INTERVAL, USER_CACHE_SIZE, WORKERS, WORKER_INDEX
+from records import FIELDS, UserRecord
+
+
+# Принадлежит ли пользователь этому процессу: супервизор отправляет апдейты пользователя воркеру
+# hash(user_id) % WORKERS, вне супервизора процесс один и обслуживает всех
+def owns(user_id: int) -> bool:
+    return WORKER_INDEX < 0 or hash(user_id) % WORKERS == WORKER_INDEX
+
+
+# Интерфейс хранилища профилей и счетчиков пользователей
+class UserStore(ABC):
+    _listeners = ()
+
+    # Подписка на изменения профилей: callback(user_id, record), при удалении record = None
+    def subscribe(self, callback):
+        self._listeners = (*self._listeners, callback)
+
+    def _notify(self, user_id: int, record):
+        for callback in self._listeners:
+            callback(user_id, record)
+
+    @abstractmethod
+    def get(self, user_id: int):
+        pass
+
+    @abstractmethod
+    def set(self, user_id: int, record: dict):
+        pass
+
+    @abstractmethod
+    def update(self, user_id: int, **fields):
+        pass
+
+    # Увеличение числового поля; возвращает обновленную запись
+    @abstractmethod
+    def increment(self, user_id: int, field: str, amount):
+        pass
+
+    @abstractmethod
+    def delete(self, user_id: int) -> bool:
+        pass
+
+    # Все профили для пакетной обработки: параллельные списки user_id и записей
+    @abstractmethod
+    def snapshot(self):
+        pass
+
+    def __contains__(self, user_id: int) -> bool:
+        return self.get(user_id) is not None
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+# Хранилище в памяти процесса (данные теряются при перезапуске)
+class MemoryUserStore(UserStore):
+    def __init__(self):
+        self._users = {}
+
+    def get(self, user_id: int):
+        return self._users.get(user_id)
+
+    def set(self, user_id: int, record: UserRecord):
+        self._users[user_id] = record
+        self._notify(user_id, record)
+
+    def update(self, user_id: int, **fields):
+        record = self._users[user_id]
+        for field, value in fields.items():
+            record.set(field, value)
+        self._notify(user_id, record)
+        return record
+
+    def increment(self, user_id: int, field: str, amount):
+        record = self._users[user_id]
+        record.set(field, getattr(record, field) + amount)
+        self._notify(user_id, record)
+        return record
+
+    def delete(self, user_id: int) -> bool:
+        self._notify(user_id, None)
+        return self._users.pop(user_id, None) is not None
+
+    def snapshot(self):
+        return list(self._users), list(self._users.values())
+
+    def __len__(self):
+        return len(self._users)
+
+
+# Хранилище в SQLite (WAL) с кэшем горячих пользователей и отложенной пакетной записью.
+# Запись идет в отдельном потоке через свое соединение; чтение в цикле событий - через второе соединение,
+# которое в режиме WAL не ждет окончания записи
+class SQLiteUserStore(UserStore):
+    def __init__(self, path: str, flush_interval: float, cache_size: int):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.commit()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()  # соединение для записи
+        self._cache = OrderedDict()  # user_id -> record
+        self._absent = OrderedDict()  # user_id пользователей без профиля (чтобы не читать базу при каждом запросе)
+        self._dirty = {}  # user_id -> record или None (удаление)
+        self._flushing = {}  # изменения, которые сейчас записываются на диск
+        self._flusher = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def get(self, user_id: int):
+        record = self._cache.get(user_id)
+        if record is not None:
+            self._cache.move_to_end(user_id)
+            return record
+        if user_id in self._absent:
+            self._absent.move_to_end(user_id)
+            return None
+        if user_id in self._dirty:
+            record = self._dirty[user_id]
+        elif user_id in self._flushing:
+            record = self._flushing[user_id]
+        else:
+            row = self._reader.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            record = None if row is None else UserRecord.from_dict(json.loads(row[0]))
+        if record is not None:
+            self._remember(user_id, record)
+        else:
+            self._remember_absent(user_id)
+        return record
+
+    def set(self, user_id: int, record: UserRecord):
+        self._absent.pop(user_id, None)
+        self._remember(user_id, record)
+        self._dirty[user_id] = record
+        self._notify(user_id, record)
+
+    def update(self, user_id: int, **fields):
+        record = self.get(user_id)
+        for field, value in fields.items():
+            record.set(field, value)
+        self._dirty[user_id] = record
+        self._notify(user_id, record)
+        return record
+
+    def increment(self, user_id: int, field: str, amount):
+        record = self.get(user_id)
+        record.set(field, getattr(record, field) + amount)
+        self._dirty[user_id] = record
+        self._notify(user_id, record)
+        return record
+
+    def delete(self, user_id: int) -> bool:
+        existed = self.get(user_id) is not None
+        self._cache.pop(user_id, None)
+        self._remember_absent(user_id)
+        self._dirty[user_id] = None
+        self._notify(user_id, None)
+        return existed
+
+    # Строки из базы, поверх которых накладываются еще не записанные изменения и кэш.
+    # Базу могут делить воркеры супервизора: берутся только пользователи этого воркера, иначе фоновые проходы
+    # перезаписывали бы чужие строки устаревшими копиями
+    def snapshot(self):
+        rows = self._reader.execute("SELECT user_id, data FROM users").fetchall()
+        profiles = {user_id: UserRecord.from_dict(json.loads(data)) for user_id, data in rows
+                    if user_id not in self._cache and owns(user_id)}
+        profiles.update(self._cache)
+        profiles.update(self._flushing)
+        profiles.update(self._dirty)
+        # Удаленные, но еще не записанные на диск пользователи
+        for user_id in [user_id for user_id, record in profiles.items() if record is None]:
+            del profiles[user_id]
+        return list(profiles), list(profiles.values())
+
+    def _remember(self, user_id: int, record: UserRecord):
+        self._cache[user_id] = record
+        self._cache.move_to_end(user_id)
+        # Вытесненные несохраненные записи остаются в _dirty до ближайшей записи на диск
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _remember_absent(self, user_id: int):
+        self._absent[user_id] = True
+        self._absent.move_to_end(user_id)
+        while len(self._absent) > self.cache_size:
+            self._absent.popitem(last=False)
+
+    # Пачка изменений для записи: забирается и сериализуется в потоке цикла событий, где ее меняют хэндлеры
+    def _take_batch(self):
+        batch, self._dirty = self._dirty, {}
+        self._flushing = batch
+        upserts = [(user_id, json.dumps(record.to_dict())) for user_id, record in batch.items() if record is not None]
+        deletes = [(user_id,) for user_id, record in batch.items() if record is None]
+        return batch, upserts, deletes
+
+    # Запись готовых строк одной транзакцией (можно вызывать из другого потока: словари хранилища не трогает)
+    def _write_rows(self, upserts, deletes):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)", upserts)
+            self._conn.executemany("DELETE FROM users WHERE user_id = ?", deletes)
+
+    # Завершение записи в потоке цикла событий; при ошибке изменения возвращаются в очередь
+    # (более новые версии записей, сделанные во время записи, важнее)
+    def _finish_batch(self, batch, written: bool):
+        self._flushing = {}
+        if not written:
+            self._dirty = {**batch, **self._dirty}
+            return 0
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+    # Запись накопленных изменений одной транзакцией
+    def flush(self):
+        if not self._dirty:
+            return 0
+        batch, upserts, deletes = self._take_batch()
+        try:
+            self._write_rows(upserts, deletes)
+        except BaseException:
+            self._finish_batch(batch, False)
+            raise
+        return self._finish_batch(batch, True)
+
+    # То же, но запись на диск идет в отдельном потоке и не блокирует цикл событий
+    async def flush_async(self):
+        if not self._dirty:
+            return 0
+        batch, upserts, deletes = self._take_batch()
+        try:
+            await asyncio.to_thread(self._write_rows, upserts, deletes)
+        except BaseException:
+            self._finish_batch(batch, False)
+            raise
+        return self._finish_batch(batch, True)
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_async()
+            except Exception as e:
+                # Фоновая запись не должна останавливаться: изменения остались в очереди до следующей попытки
+                print(f"Ошибка записи пользователей в SQLite: {e!r}")
+
+    async def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        self.flush()
+        self._reader.close()
+        self._conn.close()
+
+    def __len__(self):
+        return self._reader.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+# Типы столбцов для хранилища "структура массивов"; строки хранятся номерами в таблице значений.
+# NumPy импортируется только при создании столбцового хранилища
+COLUMN_DTYPES = {
+    "weight": "float64",
+    "height": "int32",
+    "age": "int32",
+    "activity": "int32",
+    "water_goal": "int32",
+    "calorie_goal": "float64",
+    "logged_water": "int32",
+    "logged_calories": "float64",
+    "burned_calories": "float64",
+    "day": "int32",
+}
+STRING_FIELDS = [field for field in FIELDS if field not in COLUMN_DTYPES]
+
+
+# Пользователь в столбцовом хранилище: читает поля из массивов по user_id (строка ищется при каждом чтении,
+# поэтому представление не указывает на чужие данные после удаления пользователя и повторного использования строки)
+class UserRow:
+    __slots__ = ("_store", "_user_id")
+
+    def __init__(self, store, user_id: int):
+        self._store = store
+        self._user_id = user_id
+
+    # Пользователь удален (представление могло пережить его у подписчиков хранилища) или поля нет - AttributeError,
+    # как у обычного объекта, чтобы работали getattr(row, field, default) и hasattr
+    def __getattr__(self, field: str):
+        try:
+            return self._store.read(self._user_id, field)
+        except KeyError:
+            raise AttributeError(field) from None
+
+
+# Хранилище в памяти в виде структуры массивов NumPy: по столбцу на поле и словарь user_id -> строка.
+# Для очень больших аудиторий: нет объекта на пользователя, только строка в массивах.
+class ColumnarUserStore(UserStore):
+    def __init__(self, capacity: int = 1024):
+        import numpy as np
+
+        self._rows = {}  # user_id -> номер строки
+        self._free = []  # строки удаленных пользователей
+        self._used = 0
+        self._columns = {field: np.zeros(capacity, dtype=dtype) for field, dtype in COLUMN_DTYPES.items()}
+        self._strings = {field: np.zeros(capacity, dtype="int32") for field in STRING_FIELDS}
+        self._values = []  # таблица строковых значений (города, часовые пояса)
+        self._value_index = {}
+
+    def _grow(self):
+        import numpy as np
+
+        capacity = len(self._columns["weight"]) * 2
+        for columns in (self._columns, self._strings):
+            for field, column in columns.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:len(column)] = column
+                columns[field] = grown
+
+    def _write(self, row: int, field: str, value):
+        if field in self._strings:
+            value = str(value)
+            index = self._value_index.get(value)
+            if index is None:
+                index = self._value_index[value] = len(self._values)
+                self._values.append(value)
+            self._strings[field][row] = index
+        else:
+            self._columns[field][row] = FIELDS[field](value)
+
+    def read(self, user_id: int, field: str):
+        row = self._rows[user_id]
+        column = self._columns.get(field)
+        if column is None:
+            return self._values[self._strings[field].item(row)]
+        return column.item(row)
+
+    def get(self, user_id: int):
+        return UserRow(self, user_id) if user_id in self._rows else None
+
+    def set(self, user_id: int, record):
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._used == len(self._columns["weight"]):
+                    self._grow()
+                row = self._used
+                self._used += 1
+            self._rows[user_id] = row
+        for field in FIELDS:
+            self._write(row, field, getattr(record, field))
+        self._notify(user_id, UserRow(self, user_id))
+
+    def update(self, user_id: int, **fields):
+        row = self._rows[user_id]
+        for field, value in fields.items():
+            self._write(row, field, value)
+        view = UserRow(self, user_id)
+        self._notify(user_id, view)
+        return view
+
+    def increment(self, user_id: int, field: str, amount):
+        row = self._rows[user_id]
+        self._write(row, field, self._columns[field].item(row) + amount)
+        view = UserRow(self, user_id)
+        self._notify(user_id, view)
+        return view
+
+    def delete(self, user_id: int) -> bool:
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return False
+        self._free.append(row)
+        self._notify(user_id, None)
+        return True
+
+    def snapshot(self):
+        user_ids = list(self._rows)
+        return user_ids, [UserRow(self, user_id) for user_id in user_ids]
+
+    def __len__(self):
+        return len(self._rows)
+
+
+# Создание хранилища по настройке USER_STORE ("memory", "sqlite" или "columnar")
+def create_user_store(kind: str = USER_STORE) -> UserStore:
+    if kind == "sqlite":
+        return SQLiteUserStore(USER_DB_PATH, USER_STORE_FLUSH_INTERVAL, USER_CACHE_SIZE)
+    if kind == "memory":
+        return MemoryUserStore()
+    if kind == "columnar":
+        return ColumnarUserStore()
+    raise ValueError(f"Unknown user store: {kind}")
+
+
+# Хранилище данных пользователей (в памяти, в SQLite или столбцами NumPy, см. USER_STORE)
+users = create_user_store()
+
+
+async def on_startup():
+    await users.start()
+
+
+# Сброс накопленных изменений при остановке
+async def on_shutdown():
+    await users.close()
@@ -0,0 +1,278 @@
+# Многопроцессный режим: один процесс получает апдейты (polling или webhook) и раздает их N воркерам
+# по хэшу user_id, поэтому состояние FSM и счетчики пользователя всегда живут в одном воркере.
+# Фоновые проходы по общему хранилищу (USER_STORE=sqlite) каждый воркер делает только по своим пользователям.
+#
+# Запуск: WORKERS=4 python supervisor.py
+import asyncio
+import importlib
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import time
+
+import aiohttp
+from aiohttp import web
+
+from config import (TOKEN, TELEGRAM_API_URL, WORKERS, WORKER_QUEUE_SIZE, WORKER_HEARTBEAT_TIMEOUT, WORKER_CONCURRENCY,
+                    SUPERVISOR_REPORT_INTERVAL, SUPERVISOR_INTAKE, WEBHOOK_BASE_URL, WEBHOOK_PATH,
+                    WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, METRICS_PORT, EVENT_LOG_DIR)
+
+TELEGRAM_API = f"{TELEGRAM_API_URL}/bot{TOKEN}"
+
+
+# Пользователь, от которого пришел апдейт (для выбора воркера)
+def update_user_id(update: dict) -> int:
+    for key, value in update.items():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user") or value.get("chat")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+    return 0
+
+
+# Процесс-воркер: свой Dispatcher и свои хранилища, апдейты приходят через очередь
+def worker_main(index: int, workers: int, updates, heartbeats, processed):
+    # Номер воркера и их число: по ним хранилище отбирает пользователей этого воркера (storage.owns)
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["WORKERS"] = str(workers)
+    # Каждому воркеру - свой журнал событий и свой порт метрик
+    os.environ["EVENT_LOG_DIR"] = os.path.join(EVENT_LOG_DIR, f"worker-{index}")
+    os.environ["METRICS_PORT"] = str(METRICS_PORT + 1 + index)
+    # config уже импортирован при загрузке этого модуля в дочернем процессе: перечитываем переменные окружения
+    import config
+    importlib.reload(config)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, updates, heartbeats, processed))
+
+
+async def _worker_loop(index: int, updates, heartbeats, processed):
+    from bot import bot, dp
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+    tasks = set()
+    stopping = False
+
+    async def heartbeat():
+        while True:
+            heartbeats[index] = time.time()
+            await asyncio.sleep(1)
+
+    async def process(update):
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            print(f"Воркер {index}: ошибка обработки апдейта {update.get('update_id')}: {e!r}")
+        finally:
+            processed[index] += 1
+            semaphore.release()
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    loop.add_signal_handler(signal.SIGTERM, stop)
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        while not stopping:
+            await semaphore.acquire()
+            try:
+                update = await loop.run_in_executor(None, updates.get, True, 1)
+            except queue.Empty:
+                semaphore.release()
+                continue
+            if update is None:
+                semaphore.release()
+                break
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        heartbeat_task.cancel()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+        await bot.session.close()
+
+
+class Supervisor:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.heartbeats = self._context.Array("d", workers, lock=False)
+        self.processed = self._context.Array("Q", workers, lock=False)
+        self.processes = [None] * workers
+        self.restarts = [0] * workers
+        self.routed = [0] * workers
+        self.blocked = 0
+
+    def start_worker(self, index: int):
+        self.heartbeats[index] = time.time()
+        process = self._context.Process(target=worker_main, name=f"bot-worker-{index}", daemon=True,
+                                        args=(index, self.workers, self.queues[index], self.heartbeats, self.processed))
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    # Отправка апдейта воркеру; при заполненной очереди ждем (обратное давление на прием апдейтов)
+    async def route(self, update: dict):
+        index = hash(update_user_id(update)) % self.workers
+        while True:
+            try:
+                self.queues[index].put_nowait(update)
+                self.routed[index] += 1
+                return
+            except queue.Full:
+                self.blocked += 1
+                await asyncio.sleep(0.01)
+
+    # Проверка здоровья: упавшие или зависшие воркеры перезапускаются
+    def check_workers(self):
+        now = time.time()
+        for index, process in enumerate(self.processes):
+            stale = now - self.heartbeats[index] > WORKER_HEARTBEAT_TIMEOUT
+            if process.is_alive() and not stale:
+                continue
+            print(f"Воркер {index} {'не отвечает' if process.is_alive() else 'упал'}, перезапуск")
+            if process.is_alive():
+                process.kill()
+            process.join(timeout=5)
+            self.replace_queue(index)
+            self.restarts[index] += 1
+            self.start_worker(index)
+
+    # Новая очередь для перезапускаемого воркера: убитый процесс мог остаться владельцем блокировки чтения старой
+    # очереди, и тогда из нее уже никто не прочитает. Оставшиеся апдейты переносим, если блокировка свободна
+    def replace_queue(self, index: int):
+        old_queue = self.queues[index]
+        new_queue = self._context.Queue(WORKER_QUEUE_SIZE)
+        moved = 0
+        while True:
+            try:
+                new_queue.put_nowait(old_queue.get_nowait())
+                moved += 1
+            except (queue.Empty, queue.Full):
+                break
+        old_queue.cancel_join_thread()
+        old_queue.close()
+        self.queues[index] = new_queue
+        if moved:
+            print(f"Воркер {index}: перенесено апдейтов в новую очередь: {moved}")
+
+    async def monitor(self):
+        last_processed = list(self.processed)
+        last_time = time.monotonic()
+        next_report = last_time + SUPERVISOR_REPORT_INTERVAL
+        while True:
+            await asyncio.sleep(1)
+            self.check_workers()
+            now = time.monotonic()
+            if now >= next_report:
+                elapsed = now - last_time
+                rates = [(current - previous) / elapsed for current, previous in zip(self.processed, last_processed)]
+                print("Воркеры: " + ", ".join(
+                    f"#{index}: {rate:.0f} апд/с, очередь {self._queue_size(index)}, перезапусков {self.restarts[index]}"
+                    for index, rate in enumerate(rates)) + f"; всего {sum(rates):.0f} апд/с")
+                last_processed, last_time = list(self.processed), now
+                next_report = now + SUPERVISOR_REPORT_INTERVAL
+
+    def _queue_size(self, index: int):
+        try:
+            return self.queues[index].qsize()
+        except NotImplementedError:
+            return "?"
+
+    def stop(self):
+        for worker_queue in self.queues:
+            try:
+                worker_queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for process in self.processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+
+# Прием апдейтов long polling'ом: сырые JSON без разбора в модели aiogram.
+# При ошибках (сеть, ответ Bot API с ok=false: 401, 409 при установленном вебхуке, 429) - пауза с ростом до 30 с
+# или retry_after из ответа
+async def poll_updates(supervisor: Supervisor, stop: asyncio.Event):
+    offset = 0
+    backoff = 1
+    async with aiohttp.ClientSession() as session:
+        while not stop.is_set():
+            try:
+                async with session.get(f"{TELEGRAM_API}/getUpdates",
+                                       params={"offset": offset, "timeout": 30}) as response:
+                    data = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Ошибка getUpdates: {e!r}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            if not data.get("ok"):
+                retry_after = (data.get("parameters") or {}).get("retry_after")
+                print(f"Ошибка getUpdates: {data.get('error_code')} {data.get('description')}")
+                await asyncio.sleep(retry_after or backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+            for update in data["result"]:
+                offset = update["update_id"] + 1
+                await supervisor.route(update)
+
+
+# Прием апдейтов вебхуком
+async def serve_webhook(supervisor: Supervisor, stop: asyncio.Event):
+    secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    async def handle(request):
+        if not secrets.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token):
+            return web.Response(body="Unauthorized", status=401)
+        await supervisor.route(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    if WEBHOOK_BASE_URL:
+        async with aiohttp.ClientSession() as session:
+            await session.post(f"{TELEGRAM_API}/setWebhook",
+                               json={"url": f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}", "secret_token": secret_token})
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_supervisor(workers: int = WORKERS):
+    supervisor = Supervisor(workers)
+    supervisor.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"Бот запущен в многопроцессном режиме: {workers} воркеров")
+    intake = serve_webhook if SUPERVISOR_INTAKE == "webhook" else poll_updates
+    intake_task = asyncio.create_task(intake(supervisor, stop))
+    monitor_task = asyncio.create_task(supervisor.monitor())
+    await stop.wait()
+    intake_task.cancel()
+    monitor_task.cancel()
+    await asyncio.gather(intake_task, monitor_task, return_exceptions=True)
+    await loop.run_in_executor(None, supervisor.stop)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_supervisor())
@@ -0,0 +1,86 @@
+import asyncio
+import secrets
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import (WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+                    WEBHOOK_MAX_CONCURRENT, WEBHOOK_DRAIN_TIMEOUT)
+
+
+# Обработчик вебхука с ограничением числа одновременно обрабатываемых апдейтов и плавной остановкой
+class BoundedRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent: int, drain_timeout: float, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.drain_timeout = drain_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._draining = False
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self._draining:
+            return web.Response(status=503)
+        # Пока все слоты заняты, ответ Telegram задерживается - это и есть обратное давление
+        await self._semaphore.acquire()
+        try:
+            return await super()._handle_request_background(bot, request)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: dict) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        finally:
+            self._semaphore.release()
+
+    # Новые апдейты больше не принимаются, уже принятые дорабатываются до таймаута
+    async def close(self) -> None:
+        self._draining = True
+        if self._background_feed_update_tasks:
+            await asyncio.wait(self._background_feed_update_tasks, timeout=self.drain_timeout)
+        await super().close()
+
+
+# Создание aiohttp-приложения, принимающего апдейты Telegram
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot, secret_token: str = None) -> web.Application:
+    secret_token = secret_token or WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    async def set_webhook():
+        await bot.set_webhook(
+            f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            max_connections=WEBHOOK_MAX_CONCURRENT,
+        )
+
+    if WEBHOOK_BASE_URL:
+        dispatcher.startup.register(set_webhook)
+
+    app = web.Application()
+    BoundedRequestHandler(
+        dispatcher, bot,
+        max_concurrent=WEBHOOK_MAX_CONCURRENT,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT,
+        secret_token=secret_token,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+# Запуск бота в режиме вебхука
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    runner = web.AppRunner(create_webhook_app(dispatcher, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    # Ожидание сигнала остановки, затем плавное завершение обработки
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,134 @@
+from config import NUTRITIONIX_API_URL, NUTRITIONIX_API_KEY, NUTRITIONIX_APP_ID, WORKOUT_RATE_CACHE_SIZE
+from cache import TTLCache, normalize_query
+from http_client import UpstreamError, upstreams
+
+# MET (метаболический эквивалент) для распространенных тренировок (Compendium of Physical Activities)
+MET_TABLE = {
+    "running": 9.8,
+    "jogging": 7.0,
+    "walking": 3.5,
+    "hiking": 6.0,
+    "swimming": 6.0,
+    "cycling": 7.5,
+    "yoga": 2.5,
+    "pilates": 3.0,
+    "stretching": 2.3,
+    "strength": 5.0,
+    "aerobics": 7.3,
+    "dancing": 5.0,
+    "boxing": 7.8,
+    "jumping rope": 11.0,
+    "rowing": 7.0,
+    "skiing": 7.0,
+    "skating": 7.0,
+    "football": 7.0,
+    "basketball": 6.5,
+    "volleyball": 4.0,
+    "tennis": 7.3,
+    "hockey": 8.0,
+    "martial arts": 10.3,
+    "climbing": 8.0,
+    "crossfit": 8.0,
+    "elliptical": 5.0,
+}
+
+# Синонимы (русские и английские) -> ключ таблицы MET
+ACTIVITY_SYNONYMS = {
+    "бег": "running", "пробежка": "running", "run": "running", "running": "running",
+    "бег трусцой": "jogging", "трусца": "jogging", "jogging": "jogging", "jog": "jogging",
+    "ходьба": "walking", "прогулка": "walking", "walking": "walking", "walk": "walking",
+    "поход": "hiking", "хайкинг": "hiking", "hiking": "hiking",
+    "плавание": "swimming", "бассейн": "swimming", "swimming": "swimming", "swim": "swimming",
+    "велосипед": "cycling", "велоспорт": "cycling", "велотренажер": "cycling", "cycling": "cycling",
+    "bike": "cycling", "biking": "cycling",
+    "йога": "yoga", "yoga": "yoga",
+    "пилатес": "pilates", "pilates": "pilates",
+    "растяжка": "stretching", "стретчинг": "stretching", "stretching": "stretching",
+    "силовая": "strength", "тренажеры": "strength", "качалка": "strength", "gym": "strength",
+    "weightlifting": "strength", "strength": "strength",
+    "аэробика": "aerobics", "aerobics": "aerobics",
+    "танцы": "dancing", "dancing": "dancing", "dance": "dancing",
+    "бокс": "boxing", "boxing": "boxing",
+    "скакалка": "jumping rope", "jumping rope": "jumping rope",
+    "гребля": "rowing", "rowing": "rowing",
+    "лыжи": "skiing", "skiing": "skiing",
+    "коньки": "skating", "skating": "skating",
+    "футбол": "football", "football": "football", "soccer": "football",
+    "баскетбол": "basketball", "basketball": "basketball",
+    "волейбол": "volleyball", "volleyball": "volleyball",
+    "теннис": "tennis", "tennis": "tennis",
+    "хоккей": "hockey", "hockey": "hockey",
+    "единоборства": "martial arts", "martial arts": "martial arts",
+    "скалолазание": "climbing", "climbing": "climbing",
+    "кроссфит": "crossfit", "crossfit": "crossfit",
+    "эллипс": "elliptical", "elliptical": "elliptical",
+}
+
+NUTRITIONIX_HEADERS = {
+    "x-app-id": NUTRITIONIX_APP_ID,
+    "x-app-key": NUTRITIONIX_API_KEY,
+    "Content-Type": "application/json"
+}
+
+# Кэш ответов Nutritionix: активность -> ккал на кг веса в минуту (или None, если не найдена)
+workout_rate_cache = TTLCache(WORKOUT_RATE_CACHE_SIZE, float("inf"))
+
+
+def normalize_activity(activity: str) -> str:
+    return normalize_query(activity).replace("ё", "е")
+
+
+# Расчет калорий по MET: MET * 3.5 * вес / 200 ккал в минуту
+def met_calories(met: float, weight: float, minutes: float) -> float:
+    return met * 3.5 * weight / 200 * minutes
+
+
+# Локальная оценка (None, если активности нет в таблице MET)
+def local_workout_calories(activity: str, weight: float, minutes: float):
+    met_key = ACTIVITY_SYNONYMS.get(normalize_activity(activity))
+    if met_key is None:
+        return None
+    return met_calories(MET_TABLE[met_key], weight, minutes)
+
+
+# Запрос к Nutritionix: ккал на кг в минуту для активности или None, если она не распознана
+async def fetch_nutritionix_rate(activity: str, user, minutes: int, session):
+    request_data = {
+        "query": f"{minutes} minutes of {activity}",
+        "weight_kg": user.weight,
+        "height_cm": user.height,
+        "age": user.age
+    }
+
+    async def request():
+        async with session.post(NUTRITIONIX_API_URL, headers=NUTRITIONIX_HEADERS, json=request_data) as response:
+            if response.status != 200:
+                raise UpstreamError("nutritionix", response.status)
+            return await response.json()
+
+    # POST: предельное время и размыкатель цепи, но без повторов и дублирования
+    data = await upstreams["nutritionix"].call(request, idempotent=False)
+
+    if not data.get("exercises"):
+        return None
+    exercise = data["exercises"][0]
+    duration = exercise.get("duration_min") or minutes
+    # Без веса или длительности ставку на кг в минуту не вывести
+    if user.weight <= 0 or duration <= 0:
+        return None
+    return exercise["nf_calories"] / (user.weight * duration)
+
+
+# Калории за тренировку: сначала таблица MET, затем закэшированная ставка Nutritionix, затем запрос к API
+async def workout_calories(activity: str, minutes: int, user, session):
+    calories = local_workout_calories(activity, user.weight, minutes)
+    if calories is not None:
+        return calories
+
+    # Профиль без веса не должен попасть в общий кэш ставок как "активность не найдена"
+    if user.weight <= 0:
+        return None
+    key = normalize_activity(activity)
+    rate = await workout_rate_cache.get_or_fetch(
+        key, lambda: fetch_nutritionix_rate(key, user, minutes, session))
+    return None if rate is None else rate * user.weight * minutes